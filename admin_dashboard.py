@@ -1,12 +1,14 @@
 import os
 import subprocess
 import tkinter as tk
-from datetime import datetime, timedelta
 from tkinter import ttk, messagebox
 
 from dotenv import load_dotenv
 from twilio.rest import Client
 
+from db_handler import normalize_username
+from invoice_store import InvoiceStore
+
 load_dotenv()
 
 # Twilio credentials
@@ -20,6 +22,7 @@ class AdminDashboard:
         self.root = root
         self.db = db
         self.selected_invoice_filename = None
+        self.invoice_store = InvoiceStore()
         self.open_button = None
         self.show_dashboard()
 
@@ -31,7 +34,7 @@ class AdminDashboard:
 
         # Team and Employee Selection
         tk.Label(self.root, text="Select Team:").grid(row=1, column=0, sticky='e')
-        self.team_combobox = ttk.Combobox(self.root, values=["Team 1", "Team 2", "Team 3", "Team 4"])
+        self.team_combobox = ttk.Combobox(self.root, values=self.get_teams())
         self.team_combobox.grid(row=1, column=1, padx=5, pady=5)
         self.team_combobox.bind("<<ComboboxSelected>>", self.show_team_entries)
 
@@ -64,6 +67,11 @@ class AdminDashboard:
         employees = self.db.query("SELECT username FROM users WHERE role = 'employee'")
         return [emp[0] for emp in employees]
 
+    def get_teams(self):
+        """Fetch the team names for the dropdown."""
+        teams = self.db.query("SELECT name FROM teams ORDER BY name")
+        return [team[0] for team in teams]
+
     def show_team_entries(self, event):
         selected_team = self.team_combobox.get()
         self.refresh_tree_view(self.team_tree, selected_team)
@@ -79,14 +87,15 @@ class AdminDashboard:
             tree.delete(row)
 
         entries = self.db.query(
-            "SELECT u.username, t.date, t.start_time, t.end_time "
-            "FROM users u JOIN time_entries t ON u.username = t.username "
-            "WHERE u.username LIKE ? OR u.team LIKE ?",
+            "SELECT u.username, t.date, t.start_time, t.end_time, ROUND(t.worked_min / 60.0, 2) "
+            "FROM users u JOIN time_entries t ON u.id = t.user_id "
+            "LEFT JOIN team_members tm ON tm.user_id = u.id "
+            "LEFT JOIN teams tt ON tt.id = tm.team_id "
+            "WHERE u.username LIKE ? OR tt.name LIKE ?",
             (f"%{filter_value}%", f"%{filter_value}%")
         )
 
-        for username, date, start, end in entries:
-            total_hours = self.calculate_hours(start, end)
+        for username, date, start, end, total_hours in entries:
             tree.insert("", tk.END, values=(username, date, start, end, total_hours))
 
     def show_previous_invoices(self, employee):
@@ -96,8 +105,8 @@ class AdminDashboard:
 
         invoices = self.db.query(
             "SELECT invoice_number, date, total_hours, total_payment, filename "
-            "FROM invoices WHERE username = ? ORDER BY date DESC",
-            (employee,)
+            "FROM invoices WHERE username_key = ? ORDER BY date DESC",
+            (normalize_username(employee),)
         )
 
         for invoice in invoices:
@@ -109,7 +118,8 @@ class AdminDashboard:
         if selected_item:
             invoice = self.invoice_tree.item(selected_item)['values']
             if len(invoice) >= 5:
-                self.selected_invoice_filename = invoice[4]
+                # Prefer the invoice store; rows may also hold an old absolute path
+                self.selected_invoice_filename = self.invoice_store.find(invoice[0]) or invoice[4]
                 self.open_button.config(state=tk.NORMAL)
             else:
                 self.selected_invoice_filename = None
@@ -138,12 +148,6 @@ class AdminDashboard:
             messagebox.showerror("Error", f"Invoice file not found: {self.selected_invoice_filename}")
             print(f"Invoice file not found: {self.selected_invoice_filename}")
 
-    def calculate_hours(self, start, end):
-        """Calculate the total hours between start and end times, minus a 30-minute break."""
-        start_dt = datetime.strptime(start, "%H:%M")
-        end_dt = datetime.strptime(end, "%H:%M")
-        return round((end_dt - start_dt - timedelta(minutes=30)).seconds / 3600, 2)
-
     def add_employee_form(self):
         """Display the form to add a new employee."""
         tk.Label(self.root, text="Add New Employee", font=("Arial", 12)).grid(row=7, column=0, columnspan=4, pady=10)
@@ -171,8 +175,9 @@ class AdminDashboard:
         try:
             float(rate)
             self.db.execute(
-                "INSERT INTO users (username, password, role, main_role, rate_per_hour, abn, phone_number) "
-                "VALUES (?, ?, ?, ?, ?, ?, ?)", (name, '123', 'employee', main_role, rate, abn, phone_number)
+                "INSERT INTO users (username, username_key, password, role, main_role, rate_per_hour, abn, phone_number) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (name, normalize_username(name), '123', 'employee', main_role, rate, abn, phone_number)
             )
             self.send_sms(f"+61{phone_number[1:]}", f"Welcome {name}! Your default password is '123'. Please change it.")
             messagebox.showinfo("Success", "Employee added successfully!")
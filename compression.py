@@ -0,0 +1,155 @@
+import threading
+import time
+import zlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Text types worth compressing; everything else (PDFs, images) goes out as is
+COMPRESSIBLE_TYPES = (
+    "text/html", "text/css", "text/plain", "text/csv",
+    "application/json", "application/javascript", "image/svg+xml",
+)
+
+
+class ResponseCompressor:
+    def __init__(self, min_bytes=1024, gzip_level=6, brotli_quality=4):
+        """
+        gzip or brotli compression for text responses, chosen by Accept-Encoding.
+
+        Buffered responses under ``min_bytes`` are left alone. Streamed
+        responses have no size up front and are always compressed, one
+        flushed block per chunk so the client still gets rows as they render.
+
+        Args:
+            min_bytes (int): Smallest buffered body worth compressing.
+            gzip_level (int): zlib level, 1 (fast) to 9 (small).
+            brotli_quality (int): brotli quality, 0 (fast) to 11 (small).
+        """
+        self.min_bytes = min_bytes
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.encodings = ("br", "gzip") if brotli else ("gzip",)
+
+        self._lock = threading.Lock()
+        self._stats = {
+            encoding: {"responses": 0, "bytes_in": 0, "bytes_out": 0, "cpu_ms": 0.0}
+            for encoding in self.encodings
+        }
+        self._skipped = 0
+
+    def etag_variants(self, etag):
+        """Every ETag a response tagged ``etag`` may have gone out with."""
+        return (etag,) + tuple(f"{etag}-{encoding}" for encoding in self.encodings)
+
+    def _compressor(self, encoding):
+        """Return (compress, flush, finish) callables for one response body."""
+        if encoding == "br":
+            compressor = brotli.Compressor(quality=self.brotli_quality)
+            return compressor.process, compressor.flush, compressor.finish
+        compressor = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return (
+            compressor.compress,
+            lambda: compressor.flush(zlib.Z_SYNC_FLUSH),
+            compressor.flush,
+        )
+
+    def _record(self, encoding, bytes_in, bytes_out, cpu):
+        with self._lock:
+            stats = self._stats[encoding]
+            stats["responses"] += 1
+            stats["bytes_in"] += bytes_in
+            stats["bytes_out"] += bytes_out
+            stats["cpu_ms"] += cpu * 1000
+
+    def compress(self, request, response):
+        """
+        Compress ``response`` in place if the client and content allow it.
+
+        Args:
+            request (flask.Request): The request being answered.
+            response (flask.Response): The response about to be sent.
+
+        Returns:
+            flask.Response: The same response, possibly compressed.
+        """
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESSIBLE_TYPES
+        ):
+            return response
+        response.vary.add("Accept-Encoding")
+
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if not response.is_streamed and len(response.get_data()) < self.min_bytes:
+            with self._lock:
+                self._skipped += 1
+            return response
+
+        if response.is_streamed:
+            response.response = self._stream(encoding, response.iter_encoded())
+            response.headers.pop("Content-Length", None)
+        else:
+            started = time.thread_time()
+            body = response.get_data()
+            compress, _, finish = self._compressor(encoding)
+            data = compress(body) + finish()
+            self._record(encoding, len(body), len(data), time.thread_time() - started)
+            response.set_data(data)
+
+        response.headers["Content-Encoding"] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            # A compressed body is a different representation
+            response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+    def _stream(self, encoding, chunks):
+        """Compress a streamed body chunk by chunk, flushing after each one."""
+        compress, flush, finish = self._compressor(encoding)
+        bytes_in = bytes_out = 0
+        cpu = 0.0
+        for chunk in chunks:
+            started = time.thread_time()
+            data = compress(chunk) + flush()
+            cpu += time.thread_time() - started
+            bytes_in += len(chunk)
+            bytes_out += len(data)
+            if data:
+                yield data
+        started = time.thread_time()
+        data = finish()
+        cpu += time.thread_time() - started
+        bytes_out += len(data)
+        self._record(encoding, bytes_in, bytes_out, cpu)
+        if data:
+            yield data
+
+    def stats(self):
+        """
+        Returns:
+            dict: Per-encoding response count, bytes in/out, ratio and CPU
+                time, plus settings and how many bodies were too small.
+        """
+        with self._lock:
+            encodings = {}
+            for encoding, stats in self._stats.items():
+                encodings[encoding] = dict(
+                    stats,
+                    cpu_ms=round(stats["cpu_ms"], 3),
+                    ratio=round(stats["bytes_out"] / stats["bytes_in"], 4) if stats["bytes_in"] else None,
+                )
+            return {
+                "min_bytes": self.min_bytes,
+                "gzip_level": self.gzip_level,
+                "brotli_quality": self.brotli_quality if brotli else None,
+                "skipped_small": self._skipped,
+                "encodings": encodings,
+            }
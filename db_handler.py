@@ -1,9 +1,1300 @@
 import sqlite3
 import os
+import re
+import threading
 from datetime import datetime
 
+# Persistent database location shared by the web app and the desktop client
+DB_PATH = os.environ.get("TIMESHEET_DB_PATH", "/var/data/timesheet.db")
+
+# Per-connection tuning. WAL lets readers run alongside the single writer, so
+# employees adding entries are never blocked by an admin generating invoices.
+CONNECTION_PRAGMAS = (
+    ("synchronous", "NORMAL"),       # fsync on checkpoint only; safe under WAL
+    ("busy_timeout", 5000),          # wait up to 5s for the write lock
+    ("cache_size", -16384),          # 16 MiB page cache (negative = KiB)
+    ("mmap_size", 128 * 1024 * 1024),
+    ("temp_store", "MEMORY"),
+)
+
+# Unpaid break deducted from every shift, in minutes
+BREAK_MINUTES = 30
+MINUTES_PER_DAY = 24 * 60
+
+# SQL expression turning an "HH:MM" column into minutes after midnight
+_SQL_MINUTES = (
+    "(CAST(substr({col}, 1, instr({col}, ':') - 1) AS INTEGER) * 60"
+    " + CAST(substr({col}, instr({col}, ':') + 1) AS INTEGER))"
+)
+
+# SQL expression giving the Monday that starts the ISO week of a date column
+_SQL_WEEK_START = "date({col}, '-' || ((CAST(strftime('%w', {col}) AS INTEGER) + 6) % 7) || ' days')"
+
+# Entries that count towards the hour aggregates
+_SQL_AGGREGATED = "{t}.username_key IS NOT NULL AND {t}.worked_min IS NOT NULL AND date({t}.date) IS NOT NULL"
+
+# What hours_daily and hours_weekly must contain, computed from raw entries
+AGGREGATE_SOURCES = {
+    "hours_daily": (
+        "SELECT username_key, date, SUM(worked_min), COUNT(*) FROM time_entries "
+        f"WHERE {_SQL_AGGREGATED.format(t='time_entries')} GROUP BY username_key, date"
+    ),
+    "hours_weekly": (
+        f"SELECT username_key, {_SQL_WEEK_START.format(col='date')} AS week_start, SUM(worked_min), COUNT(*) "
+        f"FROM time_entries WHERE {_SQL_AGGREGATED.format(t='time_entries')} GROUP BY username_key, week_start"
+    ),
+}
+
+# Seconds between background WAL checkpoints, and the WAL size (bytes) above
+# which the checkpointer truncates the log instead of a passive pass.
+CHECKPOINT_INTERVAL = float(os.environ.get("DB_CHECKPOINT_INTERVAL", "30"))
+CHECKPOINT_TRUNCATE_BYTES = 64 * 1024 * 1024
+
+
+def enable_wal(conn):
+    """
+    Switch the database file to WAL journal mode.
+
+    The journal mode is persistent, so this only does work the first time.
+
+    Args:
+        conn (sqlite3.Connection): An open connection with no active transaction.
+
+    Returns:
+        str: The journal mode now in effect.
+    """
+    return conn.execute("PRAGMA journal_mode = WAL").fetchone()[0]
+
+
+def configure_connection(conn, autocheckpoint=True):
+    """
+    Apply the shared connection pragmas to a new physical connection.
+
+    Args:
+        conn (sqlite3.Connection): The connection to configure.
+        autocheckpoint (bool): Leave SQLite's automatic checkpoints on. Turn
+            this off when a WalCheckpointer thread owns checkpointing.
+    """
+    for name, value in CONNECTION_PRAGMAS:
+        conn.execute(f"PRAGMA {name} = {value}")
+    if not autocheckpoint:
+        conn.execute("PRAGMA wal_autocheckpoint = 0")
+
+
+# Secondary indexes, each shaped for one of the HOT_QUERIES below. Trailing
+# columns make the index covering so the table row is never visited.
+INDEXES = (
+    ("idx_users_username_key", "users (username_key)"),
+    ("idx_time_entries_user_date", "time_entries (username_key, date, id, start_time, end_time, worked_min)"),
+    ("idx_time_entries_user_id", "time_entries (user_id)"),
+    ("idx_invoices_user_date",
+     "invoices (username_key, date, invoice_number, total_hours, total_payment, filename, sent)"),
+    ("idx_invoices_user_unsent", "invoices (username_key, sent, date)"),
+    ("idx_invoices_user_id", "invoices (user_id)"),
+    ("idx_time_entries_date", "time_entries (date)"),
+    ("idx_invoices_date", "invoices (date)"),
+    ("idx_team_members_team", "team_members (team_id)"),
+    ("idx_jobs_ready", "jobs (status, run_after)"),
+    ("idx_time_entries_open",
+     "time_entries (username_key, date, start_time, end_time, worked_min) WHERE invoice_number IS NULL"),
+)
+
+# Indexes replaced by a wider one above
+OBSOLETE_INDEXES = (
+    "idx_time_entries_username_key",
+    "idx_invoices_username_key",
+)
+
+# Queries the web app runs on every request, shared with HOT_QUERIES below so
+# the plan check sees exactly the SQL the routes execute
+LOGIN_SQL = "SELECT role FROM users WHERE username_key = ? AND password = ?"
+USER_RATE_SQL = "SELECT id, rate_per_hour AS hourly_rate FROM users WHERE username_key = ?"
+USER_ENTRIES_SQL = (
+    "SELECT date, start_time, end_time, ROUND(worked_min / 60.0, 2) AS total_hours "
+    "FROM time_entries WHERE username_key = ? ORDER BY date"
+)
+OPEN_ENTRIES_SQL = (
+    "SELECT id, date, start_time, end_time, ROUND(worked_min / 60.0, 2) AS hours, worked_min "
+    "FROM time_entries WHERE username_key = ? AND invoice_number IS NULL ORDER BY date"
+)
+WEEKLY_HOURS_SQL = (
+    "SELECT week_start, ROUND(worked_min / 60.0, 2) AS total_hours, entries FROM hours_weekly "
+    "WHERE username_key = ? ORDER BY week_start DESC LIMIT 12"
+)
+USER_INVOICES_SQL = (
+    "SELECT invoice_number, date, total_hours, total_payment, filename, sent "
+    "FROM invoices WHERE username_key = ? ORDER BY date DESC"
+)
+LATEST_INVOICE_SQL = (
+    "SELECT invoice_number, filename FROM invoices WHERE username_key = ? "
+    "ORDER BY date DESC, invoice_number DESC LIMIT 1"
+)
+LATEST_UNSENT_INVOICE_SQL = (
+    "SELECT invoice_number FROM invoices WHERE username_key = ? AND sent = 0 ORDER BY date DESC LIMIT 1"
+)
+# MAX(invoice_number) reads the rowid b-tree directly (INTEGER PRIMARY KEY)
+NEXT_INVOICE_NUMBER_SQL = "SELECT COALESCE(MAX(invoice_number), 0) + 1 FROM invoices"
+
+# Admin pages and downloads: filtered by filter_clauses() and ordered by
+# filtered_query(). Every table is joined to team_members as ``tm``.
+ADMIN_ENTRIES_SQL = (
+    "SELECT te.id, te.username, te.date, te.start_time, te.end_time, "
+    "ROUND(te.worked_min / 60.0, 2) AS total_hours, t.name AS team FROM time_entries te "
+    "LEFT JOIN team_members tm ON tm.user_id = te.user_id "
+    "LEFT JOIN teams t ON t.id = tm.team_id"
+)
+ADMIN_INVOICES_SQL = (
+    "SELECT inv.invoice_number, inv.username, inv.date, inv.total_hours, inv.total_payment, inv.filename "
+    "FROM invoices inv LEFT JOIN team_members tm ON tm.user_id = inv.user_id"
+)
+INVOICE_BUNDLE_SQL = (
+    "SELECT inv.invoice_number, inv.filename FROM invoices inv "
+    "LEFT JOIN team_members tm ON tm.user_id = inv.user_id"
+)
+
+
+def filter_clauses(filters, alias, team_id, paged=False):
+    """
+    Build the WHERE conditions shared by the time entry and invoice pages.
+
+    Both tables carry ``username_key`` and ``date``, and both are joined to
+    ``team_members`` as ``tm``, so one set of filters serves both and each
+    condition can be answered from an index.
+
+    A team filter would start from the team's members and sort their whole
+    history for every page. For a paged query it becomes a membership test
+    kept off the ``user_id`` index (unary +), so SQLite walks the date
+    index in page order, checks each row against the team's member list and
+    stops at the LIMIT.
+
+    Args:
+        filters (dict): 'employee' (username key), 'team', 'from' and 'to'.
+        alias (str): The filtered table's alias.
+        team_id (int): The id of filters['team'], if any.
+        paged (bool): The query is a LIMITed page ordered by date.
+
+    Returns:
+        tuple: (list of conditions, list of their parameters).
+    """
+    clauses, params = [], []
+    if filters['employee']:
+        clauses.append(f'{alias}.username_key = ?')
+        params.append(filters['employee'])
+    elif filters['team']:
+        if paged:
+            clauses.append(f'+{alias}.user_id IN (SELECT user_id FROM team_members WHERE team_id = ?)')
+        else:
+            clauses.append('tm.team_id = ?')
+        params.append(team_id)
+    if filters['from']:
+        clauses.append(f'{alias}.date >= ?')
+        params.append(filters['from'])
+    if filters['to']:
+        clauses.append(f'{alias}.date <= ?')
+        params.append(filters['to'])
+    return clauses, params
+
+
+def filtered_query(sql, clauses, params, alias, key_column, after=None, limit=None, newest_first=True):
+    """
+    Filter ``sql`` and order it by (date, key_column), optionally as a keyset page.
+
+    Args:
+        sql (str): The SELECT ... FROM ... JOIN part.
+        clauses (list): WHERE conditions, ANDed together.
+        params (list): Their parameters.
+        alias (str): Alias of the table carrying ``date`` and ``key_column``.
+        key_column (str): Tie-breaker after ``date``.
+        after (tuple): (date, key) of the last row already seen; only rows
+            before it (newest first) are returned.
+        limit (int): Most rows to return.
+        newest_first (bool): Order descending rather than ascending.
+
+    Returns:
+        tuple: (sql, params) ready to execute.
+    """
+    clauses, params = list(clauses), list(params)
+    if after:
+        clauses.append(f'({alias}.date, {alias}.{key_column}) < (?, ?)')
+        params.extend(after)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    order = ' DESC' if newest_first else ''
+    sql = f'{sql}{where} ORDER BY {alias}.date{order}, {alias}.{key_column}{order}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return sql, tuple(params)
+
+
+# Sample admin filters for HOT_QUERIES: everything, one employee over one
+# month, and one team
+_ALL = {'employee': None, 'team': None, 'from': None, 'to': None}
+_BY_USER = {'employee': 'key', 'team': None, 'from': '2026-01-01', 'to': '2026-01-31'}
+_BY_TEAM = {'employee': None, 'team': 'team', 'from': None, 'to': None}
+_AFTER = ('2026-01-15', 1)
+
+_ADMIN_PAGES = (
+    ("admin_entries", ADMIN_ENTRIES_SQL, 'te', 'id'),
+    ("admin_invoices", ADMIN_INVOICES_SQL, 'inv', 'invoice_number'),
+)
+
+# The per-request queries the web app runs; none of them may scan a table.
+# Admin pages are checked with and without a keyset cursor, under each filter.
+HOT_QUERIES = (
+    ("login", LOGIN_SQL, ("key", "pw")),
+    ("user_rate", USER_RATE_SQL, ("key",)),
+    ("entries_by_user", USER_ENTRIES_SQL, ("key",)),
+    ("open_entries_by_user", OPEN_ENTRIES_SQL, ("key",)),
+    ("weekly_hours_by_user", WEEKLY_HOURS_SQL, ("key",)),
+    ("invoices_by_user", USER_INVOICES_SQL, ("key",)),
+    ("latest_invoice", LATEST_INVOICE_SQL, ("key",)),
+    ("latest_unsent_invoice", LATEST_UNSENT_INVOICE_SQL, ("key",)),
+    ("next_invoice_number", NEXT_INVOICE_NUMBER_SQL, ()),
+) + tuple(
+    (f"{page}_{position}{suffix}",
+     *filtered_query(sql, *filter_clauses(filters, alias, 1, paged=True), alias, key_column, after, 51))
+    for page, sql, alias, key_column in _ADMIN_PAGES
+    for suffix, filters in (("", _ALL), ("_by_user", _BY_USER), ("_by_team", _BY_TEAM))
+    for position, after in (("first_page", None), ("page", _AFTER))
+) + (
+    ("invoice_bundle_by_user",
+     *filtered_query(INVOICE_BUNDLE_SQL, *filter_clauses(_BY_USER, 'inv', None), 'inv', 'invoice_number',
+                     newest_first=False)),
+    ("invoice_bundle_by_team",
+     *filtered_query(INVOICE_BUNDLE_SQL, *filter_clauses(_BY_TEAM, 'inv', 1), 'inv', 'invoice_number',
+                     newest_first=False)),
+)
+
+# (query name, plan step) pairs accepted anyway, each with its reason
+PLAN_EXCEPTIONS = {
+    # The bundle downloads every invoice of the team anyway: reading them
+    # through its members and sorting beats walking all invoices by date
+    ("invoice_bundle_by_team", "USE TEMP B-TREE FOR ORDER BY"),
+}
+
+# An index walked in its own order, as opposed to a full table scan
+_INDEX_WALK = re.compile(r"SCAN \S+ USING (COVERING )?INDEX ")
+
+
+def normalize_username(username):
+    """
+    Build the lookup key stored in the ``username_key`` columns.
+
+    Matches the old ``LOWER(REPLACE(username, ' ', ''))`` comparison, so
+    "Jackson Carneiro", "jackson carneiro" and "jacksoncarneiro" share a key.
+
+    Args:
+        username (str): The username as typed or stored.
+
+    Returns:
+        str: The normalized key.
+    """
+    return username.replace(" ", "").lower()
+
+
+def time_to_minutes(value):
+    """
+    Convert an "HH:MM" time string to minutes after midnight.
+
+    Args:
+        value (str): The time of day.
+
+    Returns:
+        int: Minutes after midnight.
+
+    Raises:
+        ValueError: If the value is not a valid HH:MM time.
+    """
+    hours, sep, minutes = value.partition(":")
+    if (not sep or not hours.isdigit() or not minutes.isdigit()
+            or len(hours) > 2 or len(minutes) > 2):
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    hours, minutes = int(hours), int(minutes)
+    if hours > 23 or minutes > 59:
+        raise ValueError(f"Invalid time '{value}', expected HH:MM")
+    return hours * 60 + minutes
+
+
+def shift_minutes(start_time, end_time):
+    """
+    Compute the stored minute columns for a shift.
+
+    Worked time is the span minus the unpaid break, wrapped to a day the same
+    way the dashboards always computed it, so overnight shifts still count.
+
+    Args:
+        start_time (str): Shift start as "HH:MM".
+        end_time (str): Shift end as "HH:MM".
+
+    Returns:
+        tuple: (start_min, end_min, worked_min).
+    """
+    start_min = time_to_minutes(start_time)
+    end_min = time_to_minutes(end_time)
+    return start_min, end_min, (end_min - start_min - BREAK_MINUTES) % MINUTES_PER_DAY
+
+
+def insert_time_entry(conn, username, date, start_time, end_time):
+    """
+    Insert one time entry with its username key and minute columns filled.
+
+    The caller owns the transaction and must commit.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with.
+        username (str): The employee's username.
+        date (str): The shift date as "YYYY-MM-DD".
+        start_time (str): Shift start as "HH:MM".
+        end_time (str): Shift end as "HH:MM".
+
+    Raises:
+        ValueError: If either time is not a valid HH:MM time.
+    """
+    start_min, end_min, worked_min = shift_minutes(start_time, end_time)
+    username_key = normalize_username(username)
+    conn.execute(
+        "INSERT INTO time_entries (username, username_key, user_id, date, start_time, end_time, "
+        "start_min, end_min, worked_min) "
+        "VALUES (?, ?, (SELECT id FROM users WHERE username_key = ?), ?, ?, ?, ?, ?, ?)",
+        (username, username_key, username_key, date, start_time, end_time, start_min, end_min, worked_min)
+    )
+
+
+def bill_time_entries(conn, invoice_number, entry_ids):
+    """
+    Link time entries to the invoice that billed them.
+
+    Run this in the same transaction as the invoice insert; the caller
+    commits. Only unbilled entries are stamped, so an entry can never end
+    up on two invoices.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with.
+        invoice_number (int): The invoice billing the entries.
+        entry_ids (iterable): ``time_entries.id`` of every billed entry.
+
+    Raises:
+        RuntimeError: If another invoice billed any of the entries first.
+    """
+    entry_ids = list(entry_ids)
+    cursor = conn.executemany(
+        "UPDATE time_entries SET invoice_number = ? WHERE id = ? AND invoice_number IS NULL",
+        ((invoice_number, entry_id) for entry_id in entry_ids)
+    )
+    if cursor.rowcount != len(entry_ids):
+        raise RuntimeError(
+            f"{len(entry_ids) - cursor.rowcount} of the entries for invoice {invoice_number} "
+            "were already billed"
+        )
+
+
+def bulk_insert_time_entries(conn, rows):
+    """
+    Validate and insert many time entries in a single transaction.
+
+    Every row is validated before anything is written; valid rows then go in
+    with one ``executemany`` and one commit, invalid rows are reported back.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+        rows (iterable): (username, date, start_time, end_time) tuples.
+
+    Returns:
+        list: One dict per input row: {"ok": True} or {"ok": False, "error": ...}.
+    """
+    user_ids = dict(conn.execute("SELECT username_key, id FROM users WHERE username_key IS NOT NULL"))
+    valid_dates = set()
+    results = []
+    params = []
+
+    for username, date, start_time, end_time in rows:
+        if not all([username, date, start_time, end_time]):
+            results.append({"ok": False, "error": "All fields are required"})
+            continue
+        if not all(isinstance(value, str) for value in (username, date, start_time, end_time)):
+            # JSON clients can send numbers (e.g. "start_time": 800)
+            results.append({"ok": False, "error": "Employee, date and times must be strings"})
+            continue
+        username_key = normalize_username(username)
+        if username_key not in user_ids:
+            results.append({"ok": False, "error": f"Unknown employee '{username}'"})
+            continue
+        if date not in valid_dates:
+            try:
+                datetime.strptime(date, "%Y-%m-%d")
+            except ValueError:
+                results.append({"ok": False, "error": f"Invalid date '{date}', expected YYYY-MM-DD"})
+                continue
+            valid_dates.add(date)
+        try:
+            start_min, end_min, worked_min = shift_minutes(start_time, end_time)
+        except ValueError:
+            results.append({"ok": False, "error": "Times must be in HH:MM format"})
+            continue
+
+        params.append((username, username_key, user_ids[username_key], date, start_time, end_time,
+                       start_min, end_min, worked_min))
+        results.append({"ok": True})
+
+    if params:
+        with conn:
+            conn.executemany(
+                "INSERT INTO time_entries (username, username_key, user_id, date, start_time, end_time, "
+                "start_min, end_min, worked_min) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                params
+            )
+    return results
+
+
+def add_column_if_not_exists(conn, table, column, column_type):
+    """
+    Add a column to a table if it does not already exist.
+
+    Args:
+        conn (sqlite3.Connection): The connection to alter.
+        table (str): The name of the table.
+        column (str): The name of the column to add.
+        column_type (str): The data type of the column.
+
+    Returns:
+        bool: True if the column was added.
+    """
+    columns = [info[1] for info in conn.execute(f"PRAGMA table_info({table})").fetchall()]
+    if column in columns:
+        return False
+    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+    print(f"Added column '{column}' to table '{table}'.")
+    return True
+
+
+def ensure_indexes(conn):
+    """
+    Create the indexes in INDEXES and drop the ones they superseded.
+
+    Args:
+        conn (sqlite3.Connection): The connection to update.
+
+    Returns:
+        bool: True if any index was created or dropped.
+    """
+    existing = dict(conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'index'").fetchall())
+    tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    changed = False
+    for name in OBSOLETE_INDEXES:
+        if name in existing:
+            conn.execute(f"DROP INDEX {name}")
+            changed = True
+    for name, definition in INDEXES:
+        if definition.split(" ", 1)[0] not in tables:
+            # Table comes from a later migration, which creates the index
+            continue
+        sql = f"CREATE INDEX {name} ON {definition}"
+        if existing.get(name) == sql:
+            continue
+        if name in existing:
+            # Definition changed (e.g. a covering column was added)
+            conn.execute(f"DROP INDEX {name}")
+        try:
+            conn.execute(sql)
+        except sqlite3.OperationalError as e:
+            if name in existing or "no such column" not in str(e):
+                raise
+            # Column comes from a later migration, which creates the index
+            continue
+        print(f"Created index '{name}'.")
+        changed = True
+    return changed
+
+
+def _create_baseline_tables(conn):
+    """Migration 1: the tables as they exist in production, and old leftovers removed."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE,
+            password TEXT,
+            role TEXT,
+            team TEXT,
+            main_role TEXT,
+            rate_per_hour REAL,
+            abn INTEGER,
+            status TEXT,
+            phone_number TEXT,
+            reset_token TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS time_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            date TEXT,
+            start_time TEXT,
+            end_time TEXT,
+            username TEXT
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_number INTEGER PRIMARY KEY,
+            username TEXT NOT NULL,
+            date TEXT NOT NULL,
+            total_hours REAL NOT NULL,
+            total_payment REAL NOT NULL,
+            filename TEXT NOT NULL,
+            sent INTEGER DEFAULT 0
+        )
+        """
+    )
+    add_column_if_not_exists(conn, "invoices", "sent", "INTEGER DEFAULT 0")
+    # Abandoned copy of users left behind by a GUI table editor
+    conn.execute("DROP TABLE IF EXISTS users_dg_tmp")
+
+
+def _add_username_keys(conn):
+    """Migration 2: normalized username keys and integer user references."""
+    for table in ("users", "time_entries", "invoices"):
+        add_column_if_not_exists(conn, table, "username_key", "TEXT")
+    for table in ("time_entries", "invoices"):
+        add_column_if_not_exists(conn, table, "user_id", "INTEGER REFERENCES users (id)")
+
+
+def _add_shift_minutes(conn):
+    """Migration 3: shift lengths stored as integer minutes."""
+    for column in ("start_min", "end_min", "worked_min"):
+        add_column_if_not_exists(conn, "time_entries", column, "INTEGER")
+
+
+def _create_invoice_sequence(conn):
+    """Migration 5: single-row counter that hands out invoice numbers."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS invoice_sequence (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            next_value INTEGER NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        f"INSERT OR IGNORE INTO invoice_sequence (id, next_value) SELECT 1, ({NEXT_INVOICE_NUMBER_SQL})"
+    )
+
+
+# Crews as they were hard-coded in the web app before team tables existed
+SEED_TEAMS = {
+    "Team 1 - Jackson C & Lucas C": ["Jackson Carneiro", "Lucas Cabral"],
+    "Team 2 - Bruno V & Thallys C": ["Bruno Vianello", "Thallys Carvalho"],
+    "Team 3 - Michel S & Giulliano C": ["Michel Silva", "Giulliano Cabral"],
+    "Team 4 - Pedro C & Caio H": ["Pedro Cadenas", "Caio Henrique"],
+}
+
+
+def _create_team_tables(conn):
+    """Migration 7: teams, one team per employee, and a change counter for caches."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS teams (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS team_members (
+            user_id INTEGER PRIMARY KEY REFERENCES users (id) ON DELETE CASCADE,
+            team_id INTEGER NOT NULL REFERENCES teams (id) ON DELETE CASCADE
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS data_versions (
+            scope TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 0
+        )
+        """
+    )
+    # Any change to teams or membership bumps the 'teams' version
+    for table in ("teams", "team_members"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                BEGIN
+                    INSERT INTO data_versions (scope, version) VALUES ('teams', 1)
+                    ON CONFLICT (scope) DO UPDATE SET version = version + 1;
+                END
+                """
+            )
+
+    for team, members in SEED_TEAMS.items():
+        conn.execute("INSERT OR IGNORE INTO teams (name) VALUES (?)", (team,))
+        for member in members:
+            # username_key may not be backfilled yet, so match on the expression
+            conn.execute(
+                "INSERT OR IGNORE INTO team_members (user_id, team_id) "
+                "SELECT u.id, t.id FROM users u, teams t "
+                "WHERE LOWER(REPLACE(u.username, ' ', '')) = ? AND t.name = ?",
+                (normalize_username(member), team)
+            )
+
+
+def _create_hour_aggregates(conn):
+    """Migration 9: per-employee daily and weekly hour totals kept current by triggers."""
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hours_daily (
+            username_key TEXT NOT NULL,
+            date TEXT NOT NULL,
+            worked_min INTEGER NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (username_key, date)
+        ) WITHOUT ROWID
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS hours_weekly (
+            username_key TEXT NOT NULL,
+            week_start TEXT NOT NULL,
+            worked_min INTEGER NOT NULL,
+            entries INTEGER NOT NULL,
+            PRIMARY KEY (username_key, week_start)
+        ) WITHOUT ROWID
+        """
+    )
+
+    def add(row):
+        return f"""
+            INSERT INTO hours_daily (username_key, date, worked_min, entries)
+            VALUES ({row}.username_key, {row}.date, {row}.worked_min, 1)
+            ON CONFLICT (username_key, date) DO UPDATE
+            SET worked_min = worked_min + excluded.worked_min, entries = entries + 1;
+            INSERT INTO hours_weekly (username_key, week_start, worked_min, entries)
+            VALUES ({row}.username_key, {_SQL_WEEK_START.format(col=row + '.date')}, {row}.worked_min, 1)
+            ON CONFLICT (username_key, week_start) DO UPDATE
+            SET worked_min = worked_min + excluded.worked_min, entries = entries + 1;
+        """
+
+    def remove(row):
+        week_start = _SQL_WEEK_START.format(col=row + ".date")
+        return f"""
+            UPDATE hours_daily SET worked_min = worked_min - {row}.worked_min, entries = entries - 1
+            WHERE username_key = {row}.username_key AND date = {row}.date;
+            DELETE FROM hours_daily
+            WHERE username_key = {row}.username_key AND date = {row}.date AND entries <= 0;
+            UPDATE hours_weekly SET worked_min = worked_min - {row}.worked_min, entries = entries - 1
+            WHERE username_key = {row}.username_key AND week_start = {week_start};
+            DELETE FROM hours_weekly
+            WHERE username_key = {row}.username_key AND week_start = {week_start} AND entries <= 0;
+        """
+
+    triggers = (
+        ("trg_time_entries_hours_insert", "AFTER INSERT", "NEW", add("NEW")),
+        ("trg_time_entries_hours_delete", "AFTER DELETE", "OLD", remove("OLD")),
+        ("trg_time_entries_hours_update_old", "AFTER UPDATE OF username_key, date, worked_min", "OLD", remove("OLD")),
+        ("trg_time_entries_hours_update_new", "AFTER UPDATE OF username_key, date, worked_min", "NEW", add("NEW")),
+    )
+    for name, event, row, body in triggers:
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS {name} {event} ON time_entries "
+            f"WHEN {_SQL_AGGREGATED.format(t=row)} BEGIN {body} END"
+        )
+
+    # Seed from entries that are already complete; rows still waiting on a
+    # backfill are added by the UPDATE triggers when the backfill reaches them
+    for table, source in AGGREGATE_SOURCES.items():
+        if not conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+            conn.execute(f"INSERT INTO {table} {source}")
+
+
+# Current time in whole seconds, as stored in data_versions.updated_at
+_SQL_NOW = "CAST(strftime('%s', 'now') AS INTEGER)"
+
+
+def _bump_versions(scopes):
+    """Trigger body statements that bump each data_versions scope expression."""
+    return "".join(
+        f"""
+            INSERT INTO data_versions (scope, version, updated_at) VALUES ({scope}, 1, {_SQL_NOW})
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+        """
+        for scope in scopes
+    )
+
+
+def _bump_team_version(row):
+    """Trigger body statement bumping the version of the team a row's employee is in."""
+    return f"""
+            INSERT INTO data_versions (scope, version, updated_at)
+            SELECT 'team:' || tm.team_id, 1, {_SQL_NOW} FROM users u JOIN team_members tm ON tm.user_id = u.id
+            WHERE u.username_key = {row}.username_key
+            ON CONFLICT (scope) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at;
+    """
+
+
+def _create_change_triggers(conn):
+    """
+    Migration 10: bump data_versions whenever rows a page is built from change.
+
+    Scopes: 'user:<username_key>' for one employee's rows, 'team:<id>' for
+    their team, 'all' for any entry or invoice, and 'users' for the roster.
+    """
+    for table in ("time_entries", "invoices"):
+        for event, rows in (("INSERT", ("NEW",)), ("DELETE", ("OLD",)), ("UPDATE", ("OLD", "NEW"))):
+            body = _bump_versions(["'all'"])
+            for row in rows:
+                body += _bump_versions([f"'user:' || {row}.username_key"]) + _bump_team_version(row)
+            conn.execute(
+                f"CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version "
+                f"AFTER {event} ON {table} BEGIN {body} END"
+            )
+    for event, row in (("INSERT", "NEW"), ("DELETE", "OLD"), ("UPDATE", "NEW")):
+        body = _bump_versions(["'users'", f"'user:' || {row}.username_key"])
+        conn.execute(
+            f"CREATE TRIGGER IF NOT EXISTS trg_users_{event.lower()}_version "
+            f"AFTER {event} ON users BEGIN {body} END"
+        )
+
+
+def _add_version_timestamps(conn):
+    """
+    Migration 11: record when each data_versions scope last changed.
+
+    The time backs Last-Modified headers. Every version trigger is dropped
+    and recreated so the bump also stamps ``updated_at``.
+    """
+    add_column_if_not_exists(conn, "data_versions", "updated_at", "INTEGER")
+    conn.execute(f"UPDATE data_versions SET updated_at = {_SQL_NOW} WHERE updated_at IS NULL")
+    triggers = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_%_version'"
+    ).fetchall()
+    for (name,) in triggers:
+        conn.execute(f"DROP TRIGGER {name}")
+    body = _bump_versions(["'teams'"])
+    for table in ("teams", "team_members"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            conn.execute(
+                f"CREATE TRIGGER trg_{table}_{event.lower()}_version "
+                f"AFTER {event} ON {table} BEGIN {body} END"
+            )
+    _create_change_triggers(conn)
+
+
+def _create_jobs_table(conn):
+    """
+    Migration 12: persisted background jobs (invoice renders).
+
+    At most one queued or running job may share a ``dedup_key``, so a second
+    identical request joins the pending job instead of queueing another.
+    """
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            dedup_key TEXT,
+            status TEXT NOT NULL DEFAULT 'queued'
+                CHECK (status IN ('queued', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            result TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            run_after REAL NOT NULL,
+            started_at REAL,
+            finished_at REAL
+        )
+        """
+    )
+    conn.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_active_dedup ON jobs (dedup_key) "
+        "WHERE status IN ('queued', 'running')"
+    )
+    ensure_indexes(conn)
+
+
+def _add_job_progress(conn):
+    """Migration 13: how far a long-running job (a payroll run) has got."""
+    add_column_if_not_exists(conn, "jobs", "progress", "TEXT")
+
+
+def _link_entries_to_invoices(conn):
+    """
+    Migration 14: record which invoice billed each time entry.
+
+    Un-billed entries get their own partial index, so finding what to put
+    on the next invoice never reads billed history.
+    """
+    add_column_if_not_exists(conn, "time_entries", "invoice_number", "INTEGER REFERENCES invoices (invoice_number)")
+    ensure_indexes(conn)
+
+
+def _add_page_keys_to_user_indexes(conn):
+    """
+    Migration 15: put the paging tie-breaker right after ``date``.
+
+    The per-employee admin pages order by (date, id) and (date,
+    invoice_number); with the key only at the end of the index SQLite had
+    to sort each page in a temporary b-tree. ensure_indexes drops and
+    recreates both indexes under their existing names.
+    """
+    ensure_indexes(conn)
+
+
+# Numbered schema migrations: (version, description, schema step, backfills).
+# Schema steps must be idempotent and cheap; they all run in one transaction.
+# Backfills are (table, SET clause, WHERE clause) and run afterwards in rowid
+# chunks so a big table never holds the write lock for long.
+MIGRATIONS = (
+    (1, "baseline tables", _create_baseline_tables, ()),
+    (2, "username keys", _add_username_keys, (
+        ("users", "username_key = LOWER(REPLACE(username, ' ', ''))",
+         "username_key IS NULL AND username IS NOT NULL"),
+        ("time_entries", "username_key = LOWER(REPLACE(username, ' ', ''))",
+         "username_key IS NULL AND username IS NOT NULL"),
+        ("invoices", "username_key = LOWER(REPLACE(username, ' ', ''))",
+         "username_key IS NULL AND username IS NOT NULL"),
+        ("time_entries", "user_id = (SELECT id FROM users WHERE users.username_key = time_entries.username_key)",
+         "user_id IS NULL"),
+        ("invoices", "user_id = (SELECT id FROM users WHERE users.username_key = invoices.username_key)",
+         "user_id IS NULL"),
+    )),
+    (3, "shift minutes", _add_shift_minutes, (
+        ("time_entries",
+         f"start_min = {_SQL_MINUTES.format(col='start_time')}, end_min = {_SQL_MINUTES.format(col='end_time')}",
+         "worked_min IS NULL AND start_time LIKE '%:%' AND end_time LIKE '%:%'"),
+        ("time_entries",
+         f"worked_min = ((end_min - start_min - {BREAK_MINUTES}) % {MINUTES_PER_DAY} + {MINUTES_PER_DAY})"
+         f" % {MINUTES_PER_DAY}",
+         "worked_min IS NULL AND start_min IS NOT NULL AND end_min IS NOT NULL"),
+    )),
+    (4, "dashboard and invoice indexes", ensure_indexes, ()),
+    (5, "invoice number sequence", _create_invoice_sequence, ()),
+    (6, "date indexes for admin paging", ensure_indexes, ()),
+    (7, "team tables", _create_team_tables, ()),
+    (8, "team membership indexes", ensure_indexes, ()),
+    (9, "daily and weekly hour aggregates", _create_hour_aggregates, ()),
+    (10, "data version triggers", _create_change_triggers, ()),
+    (11, "data version timestamps", _add_version_timestamps, ()),
+    (12, "job queue", _create_jobs_table, ()),
+    (13, "job progress", _add_job_progress, ()),
+    # Invoices used to bill all history, so an entry was first billed by the
+    # user's earliest invoice dated on or after it
+    (14, "invoice links on time entries", _link_entries_to_invoices, (
+        ("time_entries",
+         "invoice_number = (SELECT i.invoice_number FROM invoices i "
+         "WHERE i.username_key = time_entries.username_key AND i.date >= time_entries.date "
+         "ORDER BY i.date, i.invoice_number LIMIT 1)",
+         "invoice_number IS NULL AND EXISTS (SELECT 1 FROM invoices i "
+         "WHERE i.username_key = time_entries.username_key AND i.date >= time_entries.date)"),
+    )),
+    (15, "paging keys in per-employee indexes", _add_page_keys_to_user_indexes, ()),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+# Rows updated per backfill transaction
+BACKFILL_CHUNK_ROWS = 5000
+
+
+def run_backfill(conn, table, assignments, where, chunk_rows=BACKFILL_CHUNK_ROWS):
+    """
+    Apply an UPDATE across a table in rowid ranges, committing each chunk.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with.
+        table (str): The table to update.
+        assignments (str): The SET clause.
+        where (str): Rows still needing the backfill.
+        chunk_rows (int): Size of each rowid range.
+
+    Returns:
+        int: Number of rows updated.
+    """
+    low, high = conn.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table}").fetchone()
+    if low is None:
+        return 0
+    updated = 0
+    for start in range(low, high + 1, chunk_rows):
+        cursor = conn.execute(
+            f"UPDATE {table} SET {assignments} WHERE rowid BETWEEN ? AND ? AND ({where})",
+            (start, start + chunk_rows - 1)
+        )
+        conn.commit()
+        updated += cursor.rowcount
+    return updated
+
+
+def migrate(conn):
+    """
+    Apply any pending schema migrations.
+
+    When the database is current this is one ``PRAGMA user_version`` read.
+    Otherwise every pending schema step runs in a single IMMEDIATE
+    transaction, then the backfills run in chunks, and only after they finish
+    is ``user_version`` stamped. An interrupted backfill is simply resumed on
+    the next start.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+
+    Returns:
+        int: The schema version now in effect.
+    """
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if version >= SCHEMA_VERSION:
+        return version
+
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Another worker may have finished while we waited for the lock
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        pending = [m for m in MIGRATIONS if m[0] > version]
+        for number, description, apply, _ in pending:
+            print(f"Applying migration {number}: {description}")
+            apply(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    for number, description, _, backfills in pending:
+        for table, assignments, where in backfills:
+            run_backfill(conn, table, assignments, where)
+
+    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.execute("ANALYZE")
+    conn.commit()
+    print(f"Database schema at version {SCHEMA_VERSION}.")
+    return SCHEMA_VERSION
+
+
+def find_table_scans(conn, queries=None):
+    """
+    Run EXPLAIN QUERY PLAN over the hot queries and report full table scans.
+
+    Flagged are table scans, index scans that read the whole index, and
+    temporary b-trees (sorting or grouping every matching row). An index
+    walked in ORDER BY order is fine when the query has a LIMIT and nothing
+    is sorted: it stops after one page. Steps listed in PLAN_EXCEPTIONS are
+    accepted.
+
+    Args:
+        conn (sqlite3.Connection): The connection to inspect.
+        queries (iterable): (name, sql, params) tuples; defaults to HOT_QUERIES.
+
+    Returns:
+        list: (name, plan detail) for every step that scans instead of seeking.
+    """
+    scans = []
+    for name, sql, params in (queries if queries is not None else HOT_QUERIES):
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+        sorted_rows = any("TEMP B-TREE" in detail for detail in plan)
+        for detail in plan:
+            if (name, detail) in PLAN_EXCEPTIONS:
+                continue
+            if detail.startswith("SCAN "):
+                if " LIMIT " in sql and not sorted_rows and _INDEX_WALK.match(detail):
+                    continue
+                scans.append((name, detail))
+            elif "TEMP B-TREE" in detail:
+                scans.append((name, detail))
+    return scans
+
+
+def reserve_invoice_numbers(conn, count=1):
+    """
+    Atomically reserve a contiguous range of invoice numbers.
+
+    Runs its own short BEGIN IMMEDIATE transaction, so two workers can never
+    receive the same number. Numbers that are reserved but never used leave
+    gaps; they are never handed out twice.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+        count (int): How many numbers to reserve.
+
+    Returns:
+        range: The reserved invoice numbers.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # Stay ahead of any invoice inserted without going through the sequence
+        conn.execute(
+            f"UPDATE invoice_sequence SET next_value = MAX(next_value, ({NEXT_INVOICE_NUMBER_SQL})) + ? WHERE id = 1",
+            (count,)
+        )
+        end = conn.execute("SELECT next_value FROM invoice_sequence WHERE id = 1").fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return range(end - count, end)
+
+
+class InvoiceNumberAllocator:
+    def __init__(self, block_size=1):
+        """
+        Per-process invoice number source that reserves numbers in blocks.
+
+        With ``block_size`` above 1, one write transaction serves that many
+        invoices, which matters during bulk payroll runs. Unused numbers in a
+        block are lost when the process exits.
+
+        Args:
+            block_size (int): Numbers reserved per trip to the database.
+        """
+        self.block_size = max(1, block_size)
+        self._lock = threading.Lock()
+        self._block = iter(())
+
+    def next_number(self, conn):
+        """
+        Take the next invoice number, reserving a new block when needed.
+
+        Args:
+            conn (sqlite3.Connection): Used only when a new block is reserved.
+
+        Returns:
+            int: A number no other worker will receive.
+        """
+        with self._lock:
+            number = next(self._block, None)
+            if number is None:
+                self._block = iter(reserve_invoice_numbers(conn, self.block_size))
+                number = next(self._block)
+            return number
+
+    def take(self, conn, count):
+        """
+        Reserve ``count`` numbers in one transaction, bypassing the block.
+
+        Returns:
+            range: The reserved invoice numbers.
+        """
+        return reserve_invoice_numbers(conn, count)
+
+
+def data_versions(conn, scopes):
+    """
+    Read the change counters for a set of scopes.
+
+    Args:
+        conn (sqlite3.Connection): The connection to read with.
+        scopes (iterable): Scope names such as 'all', 'teams' or 'user:<key>'.
+
+    Returns:
+        tuple: One version per scope, in order; 0 for scopes never changed.
+    """
+    return data_version_stamp(conn, scopes)[0]
+
+
+def data_version_stamp(conn, scopes):
+    """
+    Read the change counters for a set of scopes and when they last moved.
+
+    Args:
+        conn (sqlite3.Connection): The connection to read with.
+        scopes (iterable): Scope names such as 'all', 'teams' or 'user:<key>'.
+
+    Returns:
+        tuple: (versions, updated_at) where versions has one counter per scope
+            and updated_at is the latest change in Unix seconds, or None if
+            none of the scopes ever changed.
+    """
+    scopes = tuple(scopes)
+    rows = {
+        row[0]: (row[1], row[2]) for row in conn.execute(
+            f"SELECT scope, version, updated_at FROM data_versions "
+            f"WHERE scope IN ({', '.join('?' * len(scopes))})",
+            scopes
+        )
+    }
+    versions = tuple(rows.get(scope, (0, None))[0] for scope in scopes)
+    stamps = [rows[scope][1] for scope in scopes if scope in rows and rows[scope][1] is not None]
+    return versions, max(stamps) if stamps else None
+
+
+def assign_team(conn, username, team):
+    """
+    Put an employee in a team, creating the team if needed.
+
+    An employee belongs to at most one team; assigning a new one moves them.
+    The caller owns the transaction and must commit.
+
+    Args:
+        conn (sqlite3.Connection): The connection to write with.
+        username (str): The employee's username.
+        team (str): The team name, or an empty value to remove them from any team.
+
+    Returns:
+        bool: False if no such employee exists.
+    """
+    user = conn.execute("SELECT id FROM users WHERE username_key = ?", (normalize_username(username),)).fetchone()
+    if not user:
+        return False
+    if not team:
+        conn.execute("DELETE FROM team_members WHERE user_id = ?", (user[0],))
+        return True
+    conn.execute("INSERT OR IGNORE INTO teams (name) VALUES (?)", (team,))
+    conn.execute(
+        "INSERT INTO team_members (user_id, team_id) SELECT ?, id FROM teams WHERE name = ? "
+        "ON CONFLICT (user_id) DO UPDATE SET team_id = excluded.team_id",
+        (user[0], team)
+    )
+    return True
+
+
+class TeamCache:
+    def __init__(self):
+        """
+        Per-process cache of team membership.
+
+        Every lookup first reads the 'teams' row of ``data_versions`` (one
+        primary-key seek) and reloads with a single JOIN only when another
+        process, or this one, changed a team since the last load.
+        """
+        self._lock = threading.Lock()
+        self._version = None
+        self._teams = {}
+        self._team_by_key = {}
+
+    def invalidate(self):
+        """Force the next lookup to reload membership."""
+        with self._lock:
+            self._version = None
+
+    def _current_version(self, conn):
+        row = conn.execute("SELECT version FROM data_versions WHERE scope = 'teams'").fetchone()
+        return row[0] if row else 0
+
+    def _load(self, conn, version):
+        teams, team_by_key = {}, {}
+        rows = conn.execute(
+            "SELECT t.id, t.name, u.username, u.username_key FROM teams t "
+            "LEFT JOIN team_members tm ON tm.team_id = t.id "
+            "LEFT JOIN users u ON u.id = tm.user_id "
+            "ORDER BY t.name, u.username"
+        )
+        for team_id, name, username, username_key in rows:
+            team = teams.setdefault(name, {"id": team_id, "members": []})
+            if username_key:
+                team["members"].append((username, username_key))
+                team_by_key[username_key] = name
+        self._teams, self._team_by_key, self._version = teams, team_by_key, version
+
+    def teams(self, conn):
+        """
+        Returns:
+            dict: Team name -> {"id": team id, "members": [(username, username_key), ...]}.
+        """
+        version = self._current_version(conn)
+        with self._lock:
+            if version != self._version:
+                self._load(conn, version)
+            return self._teams
+
+    def team_of(self, conn, username_key):
+        """Return the team name for a username key, or None."""
+        self.teams(conn)
+        return self._team_by_key.get(username_key)
+
+
+def check_hour_aggregates(conn):
+    """
+    Compare hours_daily and hours_weekly with totals computed from raw entries.
+
+    Args:
+        conn (sqlite3.Connection): The connection to inspect.
+
+    Returns:
+        list: (table, stored row or None, expected row or None) per mismatch.
+    """
+    mismatches = []
+    for table, source in AGGREGATE_SOURCES.items():
+        key = "date" if table == "hours_daily" else "week_start"
+        stored = {row[:2]: tuple(row) for row in conn.execute(
+            f"SELECT username_key, {key}, worked_min, entries FROM {table}")}
+        expected = {row[:2]: tuple(row) for row in conn.execute(source)}
+        for row_key in stored.keys() | expected.keys():
+            if stored.get(row_key) != expected.get(row_key):
+                mismatches.append((table, stored.get(row_key), expected.get(row_key)))
+    return mismatches
+
+
+def rebuild_hour_aggregates(conn):
+    """
+    Recompute hours_daily and hours_weekly from time_entries in one transaction.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+    """
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        for table, source in AGGREGATE_SOURCES.items():
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} {source}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+class WalCheckpointer(threading.Thread):
+    def __init__(self, db_path=DB_PATH, interval=CHECKPOINT_INTERVAL, truncate_bytes=CHECKPOINT_TRUNCATE_BYTES):
+        """
+        Background thread that checkpoints the WAL so no request pays for it.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            interval (float): Seconds between checkpoint passes.
+            truncate_bytes (int): WAL size that triggers a TRUNCATE checkpoint.
+        """
+        super().__init__(name="wal-checkpointer", daemon=True)
+        self.db_path = db_path
+        self.interval = interval
+        self.truncate_bytes = truncate_bytes
+        self._stop_event = threading.Event()
+
+    def checkpoint(self, conn):
+        """
+        Run one checkpoint pass.
+
+        Returns:
+            tuple: (busy, wal_frames, checkpointed_frames) as reported by SQLite.
+        """
+        wal_path = f"{self.db_path}-wal"
+        mode = "PASSIVE"
+        if os.path.exists(wal_path) and os.path.getsize(wal_path) > self.truncate_bytes:
+            mode = "TRUNCATE"
+        return tuple(conn.execute(f"PRAGMA wal_checkpoint({mode})").fetchone())
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        try:
+            configure_connection(conn)
+            while not self._stop_event.wait(self.interval):
+                try:
+                    self.checkpoint(conn)
+                except sqlite3.Error as e:
+                    print(f"WAL checkpoint error: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        """Ask the thread to exit after its current pass."""
+        self._stop_event.set()
+
+
 class Database:
-    def __init__(self, db_path="/var/data/timesheet.db"):
+    def __init__(self, db_path=DB_PATH):
         """
         Initialize the database connection and ensure schema updates.
 
@@ -25,6 +1316,8 @@ class Database:
         try:
             self.connection = sqlite3.connect(self.db_path, check_same_thread=False)
             self.connection.row_factory = sqlite3.Row
+            enable_wal(self.connection)
+            configure_connection(self.connection)
             print(f"Connected to SQLite database at '{self.db_path}'.")
         except sqlite3.Error as e:
             raise ConnectionError(f"Database connection error: {e}")
@@ -69,13 +1362,9 @@ class Database:
             return 0
 
     def ensure_schema_updates(self):
-        """Ensure all schema updates are applied, such as adding missing columns."""
+        """Apply any pending numbered migrations (a single version check when current)."""
         try:
-            self.add_column_if_not_exists(
-                table="invoices",
-                column="sent",
-                column_type="INTEGER DEFAULT 0"
-            )
+            migrate(self.connection)
         except sqlite3.Error as e:
             print(f"Error ensuring schema updates: {e}")
 
@@ -89,32 +1378,63 @@ class Database:
             column_type (str): The data type of the column.
         """
         try:
-            cursor = self.connection.cursor()
-            cursor.execute(f"PRAGMA table_info({table})")
-            columns = [info[1] for info in cursor.fetchall()]
-            if column not in columns:
-                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
-                print(f"Added column '{column}' to table '{table}'.")
+            if add_column_if_not_exists(self.connection, table, column, column_type):
                 self.connection.commit()
         except sqlite3.Error as e:
             print(f"Error adding column '{column}' to table '{table}': {e}")
 
+    def add_time_entry(self, username, date, start_time, end_time):
+        """
+        Save a time entry with its minute columns computed once.
+
+        Args:
+            username (str): The employee's username.
+            date (str): The shift date as "YYYY-MM-DD".
+            start_time (str): Shift start as "HH:MM".
+            end_time (str): Shift end as "HH:MM".
+
+        Raises:
+            ValueError: If either time is not a valid HH:MM time.
+        """
+        try:
+            with self.connection:
+                insert_time_entry(self.connection, username, date, start_time, end_time)
+        except sqlite3.Error as e:
+            print(f"Error saving time entry: {e}")
+
+    def bulk_insert_time_entries(self, rows):
+        """
+        Save many time entries at once, in a single transaction.
+
+        Args:
+            rows (iterable): (username, date, start_time, end_time) tuples.
+
+        Returns:
+            list: Per-row results; see bulk_insert_time_entries().
+        """
+        try:
+            return bulk_insert_time_entries(self.connection, rows)
+        except sqlite3.Error as e:
+            print(f"Error saving time entries: {e}")
+            return []
+
     def get_next_invoice_number(self):
         """
-        Get the next available invoice number.
+        Reserve the next invoice number.
+
+        The number is taken from the shared sequence, so it is never handed
+        to another client even if this invoice is never saved.
 
         Returns:
             int: The next invoice number.
         """
         try:
-            sql = "SELECT COALESCE(MAX(invoice_number), 0) + 1 AS next_id FROM invoices"
-            result = self.query(sql)
-            return result[0]['next_id'] if result else 1
+            return reserve_invoice_numbers(self.connection)[0]
         except sqlite3.Error as e:
             print(f"Error fetching next invoice number: {e}")
             return 1
 
-    def save_invoice(self, invoice_number, username, total_hours, total_payment, filename):
+    def save_invoice(self, invoice_number, username, total_hours, total_payment, filename, entry_ids=()):
         """
         Save the invoice details to the invoices table.
 
@@ -124,18 +1444,24 @@ class Database:
             total_hours (float): The total hours worked.
             total_payment (float): The total payment.
             filename (str): The file name of the invoice.
+            entry_ids (iterable): Time entries billed by the invoice; they are
+                stamped in the same transaction.
         """
         try:
             print(f"Saving invoice {invoice_number} for user '{username}'...")
-            self.execute(
-                """
-                INSERT INTO invoices (invoice_number, username, date, total_hours, total_payment, filename, sent)
-                VALUES (?, ?, ?, ?, ?, ?, ?)
-                """,
-                (invoice_number, username, datetime.now().strftime("%Y-%m-%d"), total_hours, total_payment, filename, 0)
-            )
+            with self.connection:
+                self.connection.execute(
+                    """
+                    INSERT INTO invoices (invoice_number, username, username_key, user_id, date,
+                                          total_hours, total_payment, filename, sent)
+                    VALUES (?, ?, ?, (SELECT id FROM users WHERE username_key = ?), ?, ?, ?, ?, ?)
+                    """,
+                    (invoice_number, username, normalize_username(username), normalize_username(username),
+                     datetime.now().strftime("%Y-%m-%d"), total_hours, total_payment, filename, 0)
+                )
+                bill_time_entries(self.connection, invoice_number, entry_ids)
             print("Invoice saved successfully.")
-        except sqlite3.Error as e:
+        except (sqlite3.Error, RuntimeError) as e:
             print(f"Error saving invoice: {e}")
 
     def mark_invoice_as_sent(self, invoice_number):
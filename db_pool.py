@@ -0,0 +1,222 @@
+import sqlite3
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes free within the wait timeout."""
+
+
+class ConnectionPool:
+    def __init__(self, db_path, size=5, timeout=10.0, on_connect=None):
+        """
+        A small per-process pool of SQLite connections.
+
+        Connections are opened lazily up to ``size`` and handed out per thread:
+        a thread that already holds a connection gets the same one back, so
+        nested helpers never deadlock waiting on themselves. Only the owning
+        thread may check a connection in, unless it was detach()ed first.
+
+        Args:
+            db_path (str): The path to the SQLite database file.
+            size (int): Maximum number of physical connections.
+            timeout (float): Seconds to wait for a free connection.
+            on_connect (callable): Called once with every new physical connection.
+        """
+        self.db_path = db_path
+        self.size = size
+        self.timeout = timeout
+        self.on_connect = on_connect
+
+        self._idle = []
+        self._created = 0
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        # Checked-out connection -> (owning thread, or None once detached; checkout time)
+        self._borrowed = {}
+
+        # Counters exposed through stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._hold_total = 0.0
+        self._hold_max = 0.0
+        self._released = 0
+
+    def _connect(self):
+        """Open and configure a new physical connection."""
+        conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        if self.on_connect:
+            self.on_connect(conn)
+        return conn
+
+    def checkout(self):
+        """
+        Borrow a connection for the current thread.
+
+        Returns:
+            sqlite3.Connection: A configured connection.
+
+        Raises:
+            PoolTimeout: If the pool stays exhausted for ``timeout`` seconds.
+        """
+        held = getattr(self._local, "conn", None)
+        if held is not None:
+            self._local.depth += 1
+            return held
+
+        started = time.perf_counter()
+        deadline = started + self.timeout
+        create = False
+        with self._cond:
+            waited = False
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(
+                        f"No database connection free after {self.timeout:.1f}s "
+                        f"(pool size {self.size})"
+                    )
+                waited = True
+                self._cond.wait(remaining)
+
+            if self._idle:
+                conn = self._idle.pop()
+            else:
+                # Reserve the slot now, open the connection outside the lock
+                self._created += 1
+                create = True
+
+        if create:
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._created -= 1
+                    self._cond.notify()
+                raise
+
+        now = time.perf_counter()
+        wait = now - started
+        with self._cond:
+            self._checkouts += 1
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            if waited:
+                self._waits += 1
+            self._borrowed[conn] = (threading.get_ident(), now)
+
+        self._local.conn = conn
+        self._local.depth = 1
+        return conn
+
+    def detach(self, conn):
+        """
+        Release the calling thread's claim on a connection it checked out.
+
+        The connection stays checked out, but the thread's next checkout()
+        gets another one, and checkin() may come from any thread. This hands
+        a connection to something that outlives the current call, such as a
+        streamed response body.
+
+        Args:
+            conn (sqlite3.Connection): A connection this thread checked out.
+
+        Raises:
+            RuntimeError: If the calling thread does not hold ``conn``.
+        """
+        with self._cond:
+            owner, since = self._borrowed.get(conn, (None, None))
+            if owner != threading.get_ident():
+                raise RuntimeError("Only the thread holding a connection can detach it")
+            self._borrowed[conn] = (None, since)
+        self._local.conn = None
+        self._local.depth = 0
+
+    def checkin(self, conn):
+        """
+        Return a connection borrowed with checkout().
+
+        Any transaction left open by the borrower is rolled back so the next
+        request never inherits half-finished work.
+
+        Args:
+            conn (sqlite3.Connection): The connection to return.
+
+        Raises:
+            RuntimeError: If ``conn`` is not checked out, or another thread
+                still holds it (it must detach() it first).
+        """
+        with self._cond:
+            if conn not in self._borrowed:
+                raise RuntimeError("Connection is not checked out from this pool")
+            owner, since = self._borrowed[conn]
+        if owner is not None:
+            if owner != threading.get_ident():
+                raise RuntimeError("Connection is held by another thread; detach() it before handing it over")
+            self._local.depth -= 1
+            if self._local.depth > 0:
+                return
+            self._local.conn = None
+        held = time.perf_counter() - since
+
+        broken = False
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            broken = True
+
+        with self._cond:
+            del self._borrowed[conn]
+            self._released += 1
+            self._hold_total += held
+            self._hold_max = max(self._hold_max, held)
+            if broken:
+                self._created -= 1
+            else:
+                self._idle.append(conn)
+            self._cond.notify()
+
+        if broken:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+
+    def stats(self):
+        """
+        Snapshot of pool sizing and latency counters.
+
+        Returns:
+            dict: Pool size, connections in use, and wait/hold timings in ms.
+        """
+        with self._cond:
+            checkouts = self._checkouts or 1
+            released = self._released or 1
+            return {
+                "size": self.size,
+                "timeout_s": self.timeout,
+                "created": self._created,
+                "idle": len(self._idle),
+                "in_use": self._created - len(self._idle),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "timeouts": self._timeouts,
+                "avg_wait_ms": round(self._wait_total / checkouts * 1000, 3),
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+                "avg_hold_ms": round(self._hold_total / released * 1000, 3),
+                "max_hold_ms": round(self._hold_max * 1000, 3),
+            }
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown)."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._created -= len(idle)
+        for conn in idle:
+            conn.close()
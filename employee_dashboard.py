@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
 from tkcalendar import DateEntry
-from datetime import datetime, timedelta
 from invoice_generator import generate_invoice, open_invoice
+from db_handler import normalize_username
 
 class EmployeeDashboard:
     def __init__(self, root, db, username):
@@ -68,13 +68,8 @@ class EmployeeDashboard:
         start = self.start_time_entry.get()
         end = self.end_time_entry.get()
         try:
-            # Validate time format
-            datetime.strptime(start, "%H:%M")
-            datetime.strptime(end, "%H:%M")
-            self.db.execute(
-                "INSERT INTO time_entries (username, date, start_time, end_time) VALUES (?, ?, ?, ?)",
-                (self.username, date, start, end)
-            )
+            # Validates the HH:MM format and stores the shift length once
+            self.db.add_time_entry(self.username, date, start, end)
             self.refresh_entries()
         except ValueError:
             messagebox.showerror("Invalid Time", "Enter time in HH:MM format!")
@@ -85,8 +80,8 @@ class EmployeeDashboard:
         if selected_item:
             entry = self.entry_tree.item(selected_item)['values']
             self.db.execute(
-                "DELETE FROM time_entries WHERE date = ? AND start_time = ? AND end_time = ?",
-                (entry[0], entry[1], entry[2])
+                "DELETE FROM time_entries WHERE username_key = ? AND date = ? AND start_time = ? AND end_time = ?",
+                (normalize_username(self.username), entry[0], entry[1], entry[2])
             )
             self.entry_tree.delete(selected_item)
 
@@ -95,19 +90,13 @@ class EmployeeDashboard:
         for row in self.entry_tree.get_children():
             self.entry_tree.delete(row)
         entries = self.db.query(
-            "SELECT date, start_time, end_time FROM time_entries WHERE username = ?",
-            (self.username,)
+            "SELECT date, start_time, end_time, ROUND(worked_min / 60.0, 2) FROM time_entries "
+            "WHERE username_key = ? ORDER BY date",
+            (normalize_username(self.username),)
         )
-        for date, start, end in entries:
-            total = self.calculate_hours(start, end)
+        for date, start, end, total in entries:
             self.entry_tree.insert("", tk.END, values=(date, start, end, total))
 
-    def calculate_hours(self, start, end):
-        """Calculates total hours worked minus break time."""
-        start_dt = datetime.strptime(start, "%H:%M")
-        end_dt = datetime.strptime(end, "%H:%M")
-        return round((end_dt - start_dt - timedelta(minutes=30)).seconds / 3600, 2)
-
     def create_tree_view(self, columns, row):
         """Creates a tree view widget to display entries."""
         tree = ttk.Treeview(self.root, columns=columns, show='headings', height=10)
@@ -117,39 +106,44 @@ class EmployeeDashboard:
         return tree
 
     def generate_invoice(self):
-    """Generate an invoice and display it."""
-    timesheet_data = [
-        (entry[0], entry[1], entry[2], self.calculate_hours(entry[1], entry[2]))
-        for entry in self.db.query(
-            "SELECT date, start_time, end_time FROM time_entries WHERE username = ?",
-            (self.username,)
+        """Generate an invoice and display it."""
+        username_key = normalize_username(self.username)
+        # Only entries no earlier invoice has billed
+        entries = self.db.query(
+            "SELECT id, date, start_time, end_time, ROUND(worked_min / 60.0, 2), worked_min FROM time_entries "
+            "WHERE username_key = ? AND invoice_number IS NULL ORDER BY date",
+            (username_key,)
         )
-    ]
-    total_hours = sum(entry[3] for entry in timesheet_data)
-    invoice_number = self.db.get_next_invoice_number()
-    filename = generate_invoice(invoice_number, self.username, {}, timesheet_data, total_hours)
-    
-    # Save invoice metadata to database and log the operation
-    print(f"Saving invoice: {invoice_number}, {self.username}, {filename}")
-    self.db.save_invoice(invoice_number, self.username, total_hours, total_hours * 30, filename)
-
-    open_invoice(filename)
-    self.invoice_generated = True
-    self.send_button.config(state=tk.NORMAL)
+        if not entries:
+            messagebox.showerror("Error", "No unbilled time entries to invoice.")
+            return
+        timesheet_data = [tuple(entry[1:5]) for entry in entries]
+        total_hours = sum(entry[5] or 0 for entry in entries) / 60.0
+        invoice_number = self.db.get_next_invoice_number()
+        filename = generate_invoice(invoice_number, self.username, {}, timesheet_data, total_hours)
+
+        # Save invoice metadata to database and log the operation
+        print(f"Saving invoice: {invoice_number}, {self.username}, {filename}")
+        self.db.save_invoice(invoice_number, self.username, total_hours, total_hours * 30, filename,
+                             [entry[0] for entry in entries])
+
+        open_invoice(filename)
+        self.invoice_generated = True
+        self.send_button.config(state=tk.NORMAL)
 
     def send_invoice(self):
-    """Send the generated invoice and update the database to mark it as sent."""
-    if self.invoice_generated:
-        # Assuming you have a method to retrieve the latest generated invoice for the user
-        invoice = self.db.get_latest_invoice(self.username)
-        if invoice:
-            self.db.mark_invoice_as_sent(invoice['invoice_number'])
-            messagebox.showinfo("Invoice Sent", f"Invoice {invoice['invoice_number']} sent successfully!")
-            self.refresh_invoices()  # Refresh the list of invoices
-            self.invoice_generated = False
-            self.send_button.config(state=tk.DISABLED)
+        """Send the generated invoice and update the database to mark it as sent."""
+        if self.invoice_generated:
+            # Assuming you have a method to retrieve the latest generated invoice for the user
+            invoice = self.db.get_latest_invoice(self.username)
+            if invoice:
+                self.db.mark_invoice_as_sent(invoice['invoice_number'])
+                messagebox.showinfo("Invoice Sent", f"Invoice {invoice['invoice_number']} sent successfully!")
+                self.refresh_invoices()  # Refresh the list of invoices
+                self.invoice_generated = False
+                self.send_button.config(state=tk.DISABLED)
+            else:
+                messagebox.showerror("Error", "No invoice available to send.")
         else:
-            messagebox.showerror("Error", "No invoice available to send.")
-    else:
-        messagebox.showerror("Error", "Please generate an invoice before sending.")
+            messagebox.showerror("Error", "Please generate an invoice before sending.")
 
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+
+class InvoiceRenderCache:
+    def __init__(self, store, max_entries=1024):
+        """
+        LRU map from a hash of an invoice's inputs to the PDF already rendered for them.
+
+        Entries point at stored invoices, or hold the bytes of a render
+        whose row has not committed yet; evicting one forgets the shortcut
+        and never deletes a stored PDF, which stays an issued invoice.
+
+        Args:
+            store (InvoiceStore): Where the invoice PDFs live.
+            max_entries (int): Most input hashes remembered at once.
+        """
+        self.store = store
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(*inputs):
+        """
+        Hash everything that ends up on the page.
+
+        Args:
+            *inputs: JSON-serializable render inputs (employee, timesheet rows,
+                hours, rate, company info, template version).
+
+        Returns:
+            str: A hex SHA-256 digest.
+        """
+        payload = json.dumps(inputs, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key, valid=None):
+        """
+        Return the invoice rendered for ``key`` if its PDF is held or still stored.
+
+        Args:
+            key (str): From key().
+            valid (callable): Extra check on the cached invoice (e.g. that its
+                row still exists); a stale entry is dropped and counts as a miss.
+
+        Returns:
+            dict: The invoice's number and filename, plus its bytes under
+                'pdf' while they are held, or None on a miss.
+        """
+        with self._lock:
+            invoice = self._entries.get(key)
+        if invoice is not None and (
+            ("pdf" not in invoice and not self.store.exists(invoice["invoice_number"], invoice["filename"]))
+            or (valid is not None and not valid(invoice))
+        ):
+            self.discard(key)
+            invoice = None
+        with self._lock:
+            if invoice is None:
+                self.misses += 1
+                return None
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(invoice)
+
+    def put(self, key, invoice):
+        """Remember the invoice rendered for ``key``, evicting the least recently used."""
+        with self._lock:
+            self._entries[key] = dict(invoice)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def discard(self, key):
+        """Forget ``key``."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
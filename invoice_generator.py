@@ -1,8 +1,13 @@
+import io
 import os
 import logging
-import stat
+import threading
+from calendar import day_name
 from datetime import datetime
+from PIL import Image
+from invoice_store import InvoiceStore
 from reportlab.lib.pagesizes import A4
+from reportlab.lib.utils import ImageReader
 from reportlab.pdfgen import canvas
 from reportlab.lib import colors
 
@@ -10,40 +15,149 @@ from reportlab.lib import colors
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def generate_invoice(invoice_number, employee_name, company_info, timesheet_data, total_hours, hourly_rate=30.0):
-    """Generate a professional PDF invoice."""
-    try:
-        # Set the target directory for storing invoices
-        target_directory = "/tmp/invoices"
-
-        # Ensure the target directory exists
-        if not os.path.exists(target_directory):
-            os.makedirs(target_directory, exist_ok=True)
-            os.chmod(target_directory, stat.S_IRWXU | stat.S_IRGRP | stat.S_IROTH)
-            logger.info(f"Created and set permissions for directory: {target_directory}")
-        else:
-            logger.info(f"Verified invoice directory exists: {target_directory}")
+# Bump whenever the PDF layout changes, so cached renders are not reused
+INVOICE_TEMPLATE_VERSION = 1
+
+LOGO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "company_logo.png")
+
+# The logo is drawn 120x80 pt; keep 3 pixels per point (216 dpi) when it is loaded
+LOGO_SIZE = (120, 80)
+LOGO_PIXELS_PER_POINT = 3
+
+WEEKDAYS = list(day_name)
 
-        # Define the full file path for the invoice
-        filename = os.path.join(target_directory, f"Invoice_{invoice_number}_{employee_name.replace(' ', '_')}.pdf")
-        logger.info(f"Attempting to create invoice file at: {filename}")
 
-        # Create the PDF
-        c = canvas.Canvas(filename, pagesize=A4)
+class InvoiceRenderContext:
+    def __init__(self, company_info, store=None, logo_path=LOGO_PATH):
+        """
+        Everything about an invoice that does not change between invoices.
 
-        # Optional: Add a company logo if it exists
-        logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "company_logo.png")
+        The logo is decoded once, when the context is built, instead of on
+        every invoice, and scaled down to the size it is printed at, so each
+        PDF embeds and compresses only the pixels it shows. The header (logo
+        and company details), the timesheet column headings and the footer
+        are drawn into every PDF as form XObjects from the same drawing code.
+
+        Args:
+            company_info (dict): Company name, address and phone for the header.
+            store (InvoiceStore): Where invoice PDFs are written; defaults to
+                the store under the data directory.
+            logo_path (str): The company logo; skipped if the file is missing.
+        """
+        self.company_info = dict(company_info)
+        self.store = store or InvoiceStore()
+
+        self.logo = None
         if os.path.exists(logo_path):
-            c.drawImage(logo_path, 30, 770, width=120, height=80)
+            try:
+                image = Image.open(logo_path)
+                image.thumbnail(
+                    (LOGO_SIZE[0] * LOGO_PIXELS_PER_POINT, LOGO_SIZE[1] * LOGO_PIXELS_PER_POINT),
+                    Image.LANCZOS
+                )
+                self.logo = ImageReader(image)
+            except OSError as e:
+                logger.warning(f"Logo could not be read, skipping it: {e}")
         else:
             logger.warning("Logo not found. Skipping logo addition.")
 
-        # Add company and invoice details
+    def draw_header(self, c):
+        """Draw the logo and company details."""
+        self._draw_form(c, "invoice_header", self._header)
+
+    def draw_columns(self, c):
+        """Draw the timesheet column headings."""
+        self._draw_form(c, "invoice_columns", self._columns)
+
+    def draw_footer(self, c):
+        """Draw the closing message."""
+        self._draw_form(c, "invoice_footer", self._footer)
+
+    def _draw_form(self, c, name, draw):
+        # A form lives in one PDF: define it on first use, reference it after
+        if not c.hasForm(name):
+            c.beginForm(name)
+            draw(c)
+            c.endForm()
+        c.doForm(name)
+
+    def _header(self, c):
+        if self.logo is not None:
+            c.drawImage(self.logo, 30, 770, width=LOGO_SIZE[0], height=LOGO_SIZE[1])
         c.setFont("Helvetica-Bold", 12)
-        c.drawString(150, 800, company_info.get("Company Name", "GOAT Removals"))
+        c.drawString(150, 800, self.company_info.get("Company Name", "GOAT Removals"))
         c.setFont("Helvetica", 10)
-        c.drawString(150, 780, company_info.get("Address", "123 Business St, Sydney, Australia"))
-        c.drawString(150, 765, f"Phone: {company_info.get('Phone', '+61 2 1234 5678')}")
+        c.drawString(150, 780, self.company_info.get("Address", "123 Business St, Sydney, Australia"))
+        c.drawString(150, 765, f"Phone: {self.company_info.get('Phone', '+61 2 1234 5678')}")
+
+    def _columns(self, c):
+        c.setFont("Helvetica-Bold", 10)
+        c.drawString(30, 650, "Date")
+        c.drawString(150, 650, "Start Time")
+        c.drawString(250, 650, "End Time")
+        c.drawString(350, 650, "Hours Worked")
+        c.line(30, 645, 500, 645)
+
+    def _footer(self, c):
+        c.setFont("Helvetica", 8)
+        c.setFillColor(colors.grey)
+        c.drawString(30, 50, "Thank you for your work! If you have any questions, contact our office.")
+
+
+# One context per company, built on first use and shared by every invoice
+# this process renders (payroll worker processes build their own)
+_render_contexts = {}
+_render_contexts_lock = threading.Lock()
+
+
+def get_render_context(company_info):
+    """
+    Return this process's render context for ``company_info``, building it once.
+
+    Args:
+        company_info (dict): Company name, address and phone for the header.
+
+    Returns:
+        InvoiceRenderContext: The shared context.
+    """
+    key = tuple(sorted(company_info.items()))
+    context = _render_contexts.get(key)
+    if context is None:
+        with _render_contexts_lock:
+            context = _render_contexts.get(key)
+            if context is None:
+                context = _render_contexts[key] = InvoiceRenderContext(company_info)
+    return context
+
+
+def generate_invoice(invoice_number, employee_name, company_info, timesheet_data, total_hours, hourly_rate=30.0,
+                     context=None, output=None):
+    """
+    Generate a professional PDF invoice (static parts come from the shared render context).
+
+    By default the PDF is written atomically to the context's invoice store.
+    Pass ``output`` (a BytesIO or any writable binary buffer) to render into
+    it instead and leave persisting the bytes to the caller.
+
+    Returns:
+        str: The path the invoice PDF was written to, or belongs at when
+            rendered into ``output``; None if rendering failed.
+    """
+    try:
+        context = context or get_render_context(company_info)
+
+        # Define the full file path for the invoice
+        filename = context.store.path(
+            invoice_number, f"Invoice_{invoice_number}_{employee_name.replace(' ', '_')}.pdf"
+        )
+        logger.info(f"Attempting to create invoice file at: {filename}")
+
+        # Create the PDF; it is only stored once complete
+        buffer = output if output is not None else io.BytesIO()
+        c = canvas.Canvas(buffer, pagesize=A4)
+
+        # Add company details, with the logo if it exists
+        context.draw_header(c)
 
         # Add invoice title and employee information
         c.setFont("Helvetica-Bold", 16)
@@ -55,19 +169,14 @@ def generate_invoice(invoice_number, employee_name, company_info, timesheet_data
         c.drawString(30, 670, f"Date Generated: {date_generated}")
 
         # Add timesheet details header
-        c.setFont("Helvetica-Bold", 10)
-        c.drawString(30, 650, "Date")
-        c.drawString(150, 650, "Start Time")
-        c.drawString(250, 650, "End Time")
-        c.drawString(350, 650, "Hours Worked")
-        c.line(30, 645, 500, 645)
+        context.draw_columns(c)
 
         # Populate timesheet data
         y = 630
+        c.setFont("Helvetica", 10)
         for entry in timesheet_data:
             date, start, end, hours = entry
-            weekday = datetime.strptime(date, "%Y-%m-%d").strftime('%A')
-            c.setFont("Helvetica", 10)
+            weekday = WEEKDAYS[datetime.fromisoformat(date).weekday()]
             c.drawString(30, y, f"{date} ({weekday})")
             c.drawString(150, y, start)
             c.drawString(250, y, end)
@@ -75,6 +184,7 @@ def generate_invoice(invoice_number, employee_name, company_info, timesheet_data
             y -= 20
             if y < 100:  # Start a new page if content exceeds the page limit
                 c.showPage()
+                c.setFont("Helvetica", 10)
                 y = 750
 
         # Add summary of hours and payment
@@ -85,10 +195,12 @@ def generate_invoice(invoice_number, employee_name, company_info, timesheet_data
         c.drawString(30, y - 70, f"Total Payment: ${total_payment:.2f}")
 
         # Add footer message
-        c.setFont("Helvetica", 8)
-        c.setFillColor(colors.grey)
-        c.drawString(30, 50, "Thank you for your work! If you have any questions, contact our office.")
+        context.draw_footer(c)
         c.save()
+        if output is not None:
+            logger.info(f"Invoice rendered in memory for: {filename}")
+            return filename
+        context.store.write(invoice_number, filename, buffer.getvalue())
 
         # Confirm file creation
         if os.path.exists(filename):
@@ -100,4 +212,4 @@ def generate_invoice(invoice_number, employee_name, company_info, timesheet_data
 
     except Exception as e:
         logger.error(f"Invoice generation failed: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -0,0 +1,194 @@
+import hashlib
+import os
+import re
+import tempfile
+import time
+
+from db_handler import DB_PATH
+
+# Invoice PDFs live next to the database, on the persistent volume
+INVOICE_STORE_DIR = os.environ.get("INVOICE_STORE_DIR", os.path.join(os.path.dirname(DB_PATH), "invoices"))
+
+# Where invoices were written before the store existed
+LEGACY_INVOICE_DIRS = ("/tmp/invoices",)
+
+_INVOICE_FILENAME = re.compile(r"Invoice_(\d+)_.*\.pdf$")
+
+
+class InvoiceStore:
+    def __init__(self, root=INVOICE_STORE_DIR):
+        """
+        Invoice PDFs on disk, sharded by a hash of the invoice number.
+
+        Invoice 42 is stored as ``<root>/a1/d0/Invoice_42_<name>.pdf`` where
+        a1d0 starts the SHA-256 of "42", so no directory grows past a few
+        files however many invoices are issued, and an invoice is found from
+        its number alone. Every write goes to a temporary file in the target
+        directory, is fsynced and then renamed into place, so a crash leaves
+        either the old file or the complete new one.
+
+        Args:
+            root (str): The store's top directory.
+        """
+        self.root = root
+
+    @staticmethod
+    def number_from_filename(filename):
+        """The invoice number in an ``Invoice_<number>_<name>.pdf`` filename, or None."""
+        match = _INVOICE_FILENAME.match(os.path.basename(filename))
+        return int(match.group(1)) if match else None
+
+    def directory(self, invoice_number):
+        """The shard directory holding ``invoice_number``."""
+        digest = hashlib.sha256(str(invoice_number).encode()).hexdigest()
+        return os.path.join(self.root, digest[:2], digest[2:4])
+
+    def path(self, invoice_number, filename):
+        """Where the PDF ``filename`` of ``invoice_number`` is stored."""
+        return os.path.join(self.directory(invoice_number), os.path.basename(filename))
+
+    def write(self, invoice_number, filename, data):
+        """
+        Atomically store an invoice PDF, replacing any previous version.
+
+        Args:
+            invoice_number (int): The invoice number; picks the shard.
+            filename (str): The PDF's filename.
+            data (bytes): The PDF.
+
+        Returns:
+            str: The stored file's path.
+        """
+        directory = self.directory(invoice_number)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(filename))
+        fd, temporary = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(filename)}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporary, path)
+        except BaseException:
+            try:
+                os.remove(temporary)
+            except FileNotFoundError:
+                pass
+            raise
+        self._sync_directory(directory)
+        return path
+
+    @staticmethod
+    def _sync_directory(directory):
+        # Make the rename itself durable; not supported everywhere (Windows)
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(fd)
+        except OSError:
+            pass
+        finally:
+            os.close(fd)
+
+    def exists(self, invoice_number, filename):
+        """True if ``filename`` of ``invoice_number`` is stored."""
+        return os.path.exists(self.path(invoice_number, filename))
+
+    def find(self, invoice_number):
+        """
+        Look an invoice's PDF up by number.
+
+        Returns:
+            str: The stored file's path, or None if there is none.
+        """
+        prefix = f"Invoice_{invoice_number}_"
+        try:
+            names = os.listdir(self.directory(invoice_number))
+        except FileNotFoundError:
+            return None
+        for name in sorted(names):
+            if name.startswith(prefix) and name.endswith(".pdf"):
+                return os.path.join(self.directory(invoice_number), name)
+        return None
+
+    def locate(self, filename):
+        """
+        Path of a stored PDF given only its filename.
+
+        Returns:
+            str: The stored file's path, or None if the name carries no
+                invoice number or the file is not stored.
+        """
+        invoice_number = self.number_from_filename(filename)
+        if invoice_number is None:
+            return None
+        path = self.path(invoice_number, filename)
+        return path if os.path.exists(path) else None
+
+    def check(self, conn, repair=False, remove_orphans=False, legacy_directories=LEGACY_INVOICE_DIRS,
+              orphan_age=3600.0):
+        """
+        Reconcile the ``invoices`` table with the PDFs in the store.
+
+        Reports rows whose PDF is missing, stored PDFs no row refers to, and
+        temporary files left by interrupted writes. With ``repair``, missing
+        PDFs still found in a legacy directory are copied into the store and
+        temporary files older than ``orphan_age`` are removed; with
+        ``remove_orphans`` so are orphans that old. Younger ones are kept: a
+        render whose invoice row is not committed yet looks exactly like one.
+
+        Args:
+            conn (sqlite3.Connection): The connection to read invoices with.
+            repair (bool): Recover missing PDFs and drop stale temporary files.
+            remove_orphans (bool): Delete stale PDFs no invoice row refers to.
+            legacy_directories (tuple): Flat directories to recover PDFs from.
+            orphan_age (float): Seconds before an orphan may be removed.
+
+        Returns:
+            dict: 'rows' and 'files' checked, plus lists of 'missing'
+                (invoice_number, filename), 'recovered' (invoice_number,
+                filename), 'orphans' (path), 'removed' (path) and
+                'temporary' (path).
+        """
+        report = {"rows": 0, "files": 0, "missing": [], "recovered": [], "orphans": [], "removed": [],
+                  "temporary": []}
+        expected = {}
+        for invoice_number, filename in conn.execute("SELECT invoice_number, filename FROM invoices"):
+            report["rows"] += 1
+            if filename:
+                expected[self.path(invoice_number, filename)] = (invoice_number, os.path.basename(filename))
+
+        stored = set()
+        cutoff = time.time() - orphan_age
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                if name.startswith(".") and name.endswith(".tmp"):
+                    report["temporary"].append(path)
+                    if repair and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        report["removed"].append(path)
+                    continue
+                report["files"] += 1
+                stored.add(path)
+                if path not in expected:
+                    report["orphans"].append(path)
+                    if remove_orphans and os.path.getmtime(path) < cutoff:
+                        os.remove(path)
+                        report["removed"].append(path)
+
+        for path, (invoice_number, filename) in sorted(expected.items(), key=lambda item: item[1]):
+            if path in stored:
+                continue
+            legacy = next((os.path.join(directory, filename) for directory in legacy_directories
+                           if os.path.exists(os.path.join(directory, filename))), None)
+            if repair and legacy:
+                with open(legacy, "rb") as f:
+                    self.write(invoice_number, filename, f.read())
+                report["recovered"].append((invoice_number, filename))
+            else:
+                report["missing"].append((invoice_number, filename))
+        return report
+
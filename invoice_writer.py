@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class InvoiceWriter:
+    def __init__(self, store, workers=1, retry_delay=1.0, max_retry_delay=60.0):
+        """
+        Writes PDFs rendered in memory to the invoice store in the background.
+
+        A request that rendered an invoice into a buffer commits its row,
+        hands the bytes over and answers the client straight from memory.
+        Until a write lands, pending() still returns the bytes, so a
+        follow-up download never misses the file. A failed write keeps the
+        bytes and is retried with exponential backoff until it succeeds. The
+        store writes atomically, so readers never see a partial PDF.
+
+        Args:
+            store (InvoiceStore): Where the PDFs are written.
+            workers (int): Writer threads.
+            retry_delay (float): Seconds before the first retry; doubles after.
+            max_retry_delay (float): Longest wait between two retries.
+        """
+        self.store = store
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="invoice-writer")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._written = 0
+        self._failed = 0
+        self._bytes = 0
+        self._write_total = 0.0
+        self._write_max = 0.0
+
+    def submit(self, invoice_number, filename, data):
+        """
+        Queue ``data`` to be stored as ``filename`` of ``invoice_number``.
+
+        Call this only once the invoice's row is committed, so a rolled back
+        invoice never leaves a PDF behind.
+
+        Args:
+            invoice_number (int): The invoice number.
+            filename (str): The PDF's filename.
+            data (bytes): The rendered PDF.
+        """
+        filename = os.path.basename(filename)
+        with self._lock:
+            self._pending[filename] = data
+        self._executor.submit(self._write, invoice_number, filename, data, 1)
+
+    def pending(self, filename):
+        """Return the bytes still waiting to be stored as ``filename``, or None."""
+        with self._lock:
+            return self._pending.get(os.path.basename(filename))
+
+    def _write(self, invoice_number, filename, data, attempt):
+        with self._lock:
+            if self._pending.get(filename) is not data:
+                # A newer render of the same file was submitted meanwhile
+                return
+        started = time.perf_counter()
+        try:
+            self.store.write(invoice_number, filename, data)
+        except OSError as e:
+            delay = min(self.retry_delay * 2 ** (attempt - 1), self.max_retry_delay)
+            with self._lock:
+                self._failed += 1
+            print(f"Failed to write invoice {filename} (attempt {attempt}), retrying in {delay:g}s: {e}")
+            retry = threading.Timer(delay, self._executor.submit,
+                                    (self._write, invoice_number, filename, data, attempt + 1))
+            retry.daemon = True
+            retry.start()
+            return
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            if self._pending.get(filename) is data:
+                del self._pending[filename]
+            self._written += 1
+            self._bytes += len(data)
+            self._write_total += elapsed
+            self._write_max = max(self._write_max, elapsed)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Pending writes, files written, failed write attempts, bytes
+                written and write times in ms.
+        """
+        with self._lock:
+            written = self._written or 1
+            return {
+                "pending": len(self._pending),
+                "written": self._written,
+                "failed": self._failed,
+                "bytes": self._bytes,
+                "avg_write_ms": round(self._write_total / written * 1000, 3),
+                "max_write_ms": round(self._write_max * 1000, 3),
+            }
@@ -0,0 +1,285 @@
+import json
+import threading
+import time
+
+
+class JobQueue:
+    def __init__(self, connect, handlers, workers=2, max_attempts=3, retry_delay=5.0,
+                 poll_interval=1.0, lease=600.0):
+        """
+        Background jobs persisted in the ``jobs`` table and run by worker threads.
+
+        Every process runs its own workers; a job is claimed with one atomic
+        UPDATE, so workers in different gunicorn processes never run the same
+        job twice. A job left 'running' longer than ``lease`` (its process
+        died) is claimed again, or failed if that was its last attempt. Each
+        worker opens one connection of its own and keeps it, so polling and
+        long renders never take a connection away from requests. Nothing runs
+        until start() is called.
+
+        A handler is called as ``handler(conn, payload, progress, on_commit)``
+        and returns a JSON-serializable result. It must not commit: its writes
+        are committed together with the job's 'done' status, after which the
+        callbacks it passed to ``on_commit`` run (a failed attempt drops
+        them). ``progress(done, total)`` records how far a long job got and
+        renews its lease, so a job that reports progress more often than
+        ``lease`` is never claimed again while it runs; it commits, so call it
+        only before the handler starts writing. Raising ValueError fails the
+        job at once; any other exception retries it with exponential backoff
+        until ``max_attempts`` is reached.
+
+        Args:
+            connect (callable): Opens a new connection for a worker thread.
+            handlers (dict): Job kind -> handler.
+            workers (int): Worker threads in this process.
+            max_attempts (int): Runs before a job is marked failed.
+            retry_delay (float): Seconds before the first retry; doubles after.
+            poll_interval (float): Seconds an idle worker waits before looking
+                again for jobs queued by other processes or due for retry.
+            lease (float): Seconds without progress after which a running job
+                is presumed lost.
+        """
+        self.connect = connect
+        self.handlers = handlers
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.poll_interval = poll_interval
+        self.lease = lease
+
+        self._threads = []
+        self._start_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._wakeup = threading.Condition()
+
+        # Counters exposed through stats()
+        self._lock = threading.Lock()
+        self._counts = {"enqueued": 0, "deduplicated": 0, "completed": 0, "retried": 0, "failed": 0}
+        self._claims = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._runs = 0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    def start(self):
+        """Start the worker threads; later calls do nothing."""
+        with self._start_lock:
+            if self._threads:
+                return
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{number}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """Ask the workers to exit after their current job."""
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def enqueue(self, conn, kind, payload, dedup_key=None):
+        """
+        Persist a job, or join the identical one already pending.
+
+        Args:
+            conn (sqlite3.Connection): A connection with no open transaction.
+            kind (str): Selects the handler.
+            payload (dict): Handler arguments, stored as JSON.
+            dedup_key (str): Jobs sharing this key while queued or running
+                are the same job.
+
+        Returns:
+            tuple: (job_id, created); created is False for a duplicate.
+        """
+        now = time.time()
+        with conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (kind, payload, dedup_key, max_attempts, created_at, run_after) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (dedup_key) WHERE status IN ('queued', 'running') DO NOTHING",
+                (kind, json.dumps(payload), dedup_key, self.max_attempts, now, now)
+            )
+            if cursor.rowcount:
+                job_id, created = cursor.lastrowid, True
+            else:
+                # Still inside the write transaction, so the pending job can't finish meanwhile
+                job_id = conn.execute(
+                    "SELECT id FROM jobs WHERE dedup_key = ? AND status IN ('queued', 'running')",
+                    (dedup_key,)
+                ).fetchone()[0]
+                created = False
+
+        with self._lock:
+            self._counts["enqueued" if created else "deduplicated"] += 1
+        if created:
+            with self._wakeup:
+                self._wakeup.notify()
+        return job_id, created
+
+    def get(self, conn, job_id):
+        """
+        Look up a job.
+
+        Returns:
+            dict: The job's status, attempts, timings, error and decoded
+                result, or None if there is no such job.
+        """
+        row = conn.execute(
+            "SELECT id, kind, status, attempts, progress, result, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "kind", "status", "attempts", "progress", "result", "error",
+                        "created_at", "started_at", "finished_at"), row))
+        job["progress"] = json.loads(job["progress"]) if job["progress"] else None
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def _claim(self, conn):
+        """
+        Atomically take the oldest runnable job; None when there is none.
+
+        A job whose lease expired after its last allowed attempt is marked
+        failed instead of being run again.
+        """
+        now = time.time()
+        with conn:
+            lost = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Lease expired on the last attempt', finished_at = ? "
+                "WHERE status = 'running' AND started_at < ? AND attempts >= max_attempts",
+                (now, now - self.lease)
+            ).rowcount
+            job = conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ? "
+                "WHERE id = ("
+                "  SELECT id FROM jobs WHERE status = 'queued' AND run_after <= ? "
+                "  UNION ALL "
+                "  SELECT id FROM jobs WHERE status = 'running' AND started_at < ? AND attempts < max_attempts "
+                "  LIMIT 1"
+                ") RETURNING id, kind, payload, attempts, max_attempts, run_after",
+                (now, now, now - self.lease)
+            ).fetchone()
+        if lost:
+            with self._lock:
+                self._counts["failed"] += lost
+        return job
+
+    def _run(self, conn, job):
+        """Run one claimed job and record its outcome."""
+        job_id, kind, payload, attempts, max_attempts, run_after = job
+        started = time.time()
+        if attempts == 1:
+            # Queue latency: enqueue to first start (retries wait on purpose)
+            with self._lock:
+                self._claims += 1
+                self._wait_total += started - run_after
+                self._wait_max = max(self._wait_max, started - run_after)
+
+        try:
+            handler = self.handlers.get(kind)
+            if handler is None:
+                raise ValueError(f"No handler for job kind '{kind}'")
+            committed = []
+            result = handler(conn, json.loads(payload), lambda done, total: self._progress(conn, job_id, done, total),
+                             committed.append)
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            self._fail(conn, job_id, attempts, max_attempts, e)
+            return
+
+        finished = time.time()
+        # The handler's writes and the job's completion commit together
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET status = 'done', result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (json.dumps(result), finished, job_id)
+            )
+        for callback in committed:
+            try:
+                callback()
+            except Exception as e:
+                # The job is done; a failed follow-up can't undo that
+                print(f"Job {job_id} commit callback failed: {e}")
+        with self._lock:
+            self._counts["completed"] += 1
+            self._runs += 1
+            self._run_total += finished - started
+            self._run_max = max(self._run_max, finished - started)
+
+    def _progress(self, conn, job_id, done, total):
+        """Record a running job's progress and renew its lease."""
+        with conn:
+            conn.execute(
+                "UPDATE jobs SET progress = ?, started_at = ? WHERE id = ? AND status = 'running'",
+                (json.dumps({"done": done, "total": total}), time.time(), job_id)
+            )
+
+    def _fail(self, conn, job_id, attempts, max_attempts, error):
+        """Schedule a retry, or mark the job failed when it can't succeed."""
+        now = time.time()
+        permanent = isinstance(error, ValueError) or attempts >= max_attempts
+        with conn:
+            if permanent:
+                conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+                    (str(error), now, job_id)
+                )
+            else:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_after = ? WHERE id = ?",
+                    (str(error), now + self.retry_delay * 2 ** (attempts - 1), job_id)
+                )
+        with self._lock:
+            self._counts["failed" if permanent else "retried"] += 1
+        print(f"Job {job_id} attempt {attempts} failed: {error}")
+
+    def _work(self):
+        conn = None
+        while not self._stop_event.is_set():
+            job = None
+            try:
+                if conn is None:
+                    conn = self.connect()
+                job = self._claim(conn)
+                if job is not None:
+                    self._run(conn, job)
+            except Exception as e:
+                # A worker thread must survive database errors; a job stuck in
+                # 'running' is picked up again after its lease
+                print(f"Job queue error: {e}")
+            if job is None:
+                with self._wakeup:
+                    self._wakeup.wait(self.poll_interval)
+        if conn is not None:
+            conn.close()
+
+    def stats(self, conn):
+        """
+        Queue depth from the table plus this process's counters.
+
+        Returns:
+            dict: Queued/running counts, age of the oldest queued job, job
+                outcome counts, and queue wait and run times in ms.
+        """
+        depth = dict(conn.execute(
+            "SELECT status, COUNT(*) FROM jobs WHERE status IN ('queued', 'running') GROUP BY status"
+        ).fetchall())
+        oldest = conn.execute("SELECT MIN(created_at) FROM jobs WHERE status = 'queued'").fetchone()[0]
+        with self._lock:
+            claims = self._claims or 1
+            runs = self._runs or 1
+            return {
+                "workers": self.workers,
+                "queued": depth.get("queued", 0),
+                "running": depth.get("running", 0),
+                "oldest_queued_s": round(time.time() - oldest, 3) if oldest else None,
+                **self._counts,
+                "avg_wait_ms": round(self._wait_total / claims * 1000, 3),
+                "max_wait_ms": round(self._wait_max * 1000, 3),
+                "avg_run_ms": round(self._run_total / runs * 1000, 3),
+                "max_run_ms": round(self._run_max * 1000, 3),
+            }
@@ -4,7 +4,7 @@ from tkinter import messagebox
 import uuid
 import sqlite3
 from dotenv import load_dotenv
-from db_handler import Database
+from db_handler import Database, normalize_username
 from twilio.rest import Client
 
 class TimesheetApp:
@@ -31,32 +31,32 @@ class TimesheetApp:
         setattr(self, f"{label.lower()}_entry", entry)  # Set the entry field to an instance variable
 
     def login(self):
-    """Handle user login."""
-    username = self.username_entry.get().strip().lower()  # Convert to lowercase and remove leading/trailing spaces
-    password = self.password_entry.get()
-    
-    print(f"Login attempt with Username: {username} and Password: {password}")
-    
-    try:
-        # Use LOWER(username) in both the database and input to ensure case insensitivity
-        user = self.db.query("SELECT role FROM users WHERE LOWER(REPLACE(username, ' ', '')) = ? AND password = ?", 
-                             (username.replace(" ", ""), password))
-        print("Query result:", user)
-        if user:
-            role = user[0][0]
-            print(f"User role found: {role}")
-            if role == 'admin':
-                from admin_dashboard import AdminDashboard
-                AdminDashboard(self.root, self.db)
-            elif role == 'employee':
-                from employee_dashboard import EmployeeDashboard
-                EmployeeDashboard(self.root, self.db, username)
-        else:
-            print("Invalid credentials")
-            messagebox.showerror("Login Failed", "Invalid credentials!")
-    except sqlite3.Error as e:
-        print(f"Exception during login: {e}")
-        messagebox.showerror("Error", "An error occurred during login.")
+        """Handle user login."""
+        username = self.username_entry.get().strip().lower()  # Convert to lowercase and remove leading/trailing spaces
+        password = self.password_entry.get()
+
+        print(f"Login attempt with Username: {username} and Password: {password}")
+
+        try:
+            # Match on the normalized username key so the lookup uses its index
+            user = self.db.query("SELECT role FROM users WHERE username_key = ? AND password = ?",
+                                 (normalize_username(username), password))
+            print("Query result:", user)
+            if user:
+                role = user[0][0]
+                print(f"User role found: {role}")
+                if role == 'admin':
+                    from admin_dashboard import AdminDashboard
+                    AdminDashboard(self.root, self.db)
+                elif role == 'employee':
+                    from employee_dashboard import EmployeeDashboard
+                    EmployeeDashboard(self.root, self.db, username)
+            else:
+                print("Invalid credentials")
+                messagebox.showerror("Login Failed", "Invalid credentials!")
+        except sqlite3.Error as e:
+            print(f"Exception during login: {e}")
+            messagebox.showerror("Error", "An error occurred during login.")
 
     def clear_window(self):
         """Clear the current window of widgets."""
@@ -73,7 +73,7 @@ class TimesheetApp:
     def send_reset_token(self):
         """Handle sending of the password reset token via SMS."""
         username = self.username_entry.get()
-        user = self.db.query("SELECT phone_number FROM users WHERE LOWER(username) = ?", (username.lower(),))
+        user = self.db.query("SELECT phone_number FROM users WHERE username_key = ?", (normalize_username(username),))
 
         if user and user[0][0]:
             phone_number = str(user[0][0]).strip()
@@ -85,7 +85,7 @@ class TimesheetApp:
 
             # Generate and store reset token
             token = uuid.uuid4().hex[:8]
-            self.db.execute("UPDATE users SET reset_token = ? WHERE LOWER(username) = ?", (token, username.lower()))
+            self.db.execute("UPDATE users SET reset_token = ? WHERE username_key = ?", (token, normalize_username(username)))
             # Send SMS with the token
             self.send_sms(phone_number, f"Your password reset token is: {token}")
             messagebox.showinfo("Success", "Reset token sent via SMS.")
@@ -0,0 +1,146 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from itertools import groupby
+
+from db_handler import bill_time_entries
+from invoice_generator import generate_invoice
+
+
+def collect_payroll(conn, period_from=None, period_to=None, team_id=None):
+    """
+    Read every active employee's unbilled time entries for a pay period in one ordered query.
+
+    Accounts registered through the app carry no status and count as
+    active; any other status (e.g. 'inactive') leaves the employee out.
+
+    Args:
+        conn (sqlite3.Connection): The connection to read with.
+        period_from (str): First date included (YYYY-MM-DD), or None.
+        period_to (str): Last date included (YYYY-MM-DD), or None.
+        team_id (int): Only this team's members, or None for everyone.
+
+    Returns:
+        list: (user_id, username_key, rate_per_hour, timesheet_data, worked_min,
+            entry_ids) per employee with unbilled entries in the period;
+            timesheet_data rows are (date, start_time, end_time, hours) as
+            generate_invoice expects.
+    """
+    clauses, params = ["u.role = 'employee'", "COALESCE(u.status, 'active') = 'active'", "te.worked_min IS NOT NULL", "te.invoice_number IS NULL"], []
+    if team_id is not None:
+        clauses.append("tm.team_id = ?")
+        params.append(team_id)
+    if period_from:
+        clauses.append("te.date >= ?")
+        params.append(period_from)
+    if period_to:
+        clauses.append("te.date <= ?")
+        params.append(period_to)
+    rows = conn.execute(
+        "SELECT u.id, u.username_key, u.rate_per_hour, te.date, te.start_time, te.end_time, "
+        "ROUND(te.worked_min / 60.0, 2) AS hours, te.worked_min, te.id "
+        "FROM users u JOIN time_entries te ON te.username_key = u.username_key "
+        "LEFT JOIN team_members tm ON tm.user_id = u.id "
+        f"WHERE {' AND '.join(clauses)} ORDER BY u.username_key, te.date",
+        params
+    )
+
+    employees = []
+    for (user_id, username_key, rate), entries in groupby(rows, key=lambda row: tuple(row[:3])):
+        entries = list(entries)
+        employees.append((
+            user_id, username_key, rate,
+            [(entry[3], entry[4], entry[5], entry[6]) for entry in entries],
+            sum(entry[7] for entry in entries),
+            [entry[8] for entry in entries],
+        ))
+    return employees
+
+
+def run_payroll(conn, allocator, company_info, period_from=None, period_to=None, team_id=None,
+                workers=None, progress=None):
+    """
+    Generate one invoice per employee for a pay period, rendering in parallel.
+
+    Invoice numbers for the whole run are reserved in one block up front.
+    Only entries no invoice has billed yet are included. PDFs are rendered
+    by generate_invoice across a process pool, and once all renders
+    succeeded every ``invoices`` row is inserted and its entries are linked
+    to it. The caller owns that transaction and must commit; if any render
+    fails nothing is written and the reserved numbers are left unused.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+        allocator (InvoiceNumberAllocator): Source of the number block.
+        company_info (dict): Printed on every invoice.
+        period_from (str): First date included, or None.
+        period_to (str): Last date included, or None.
+        team_id (int): Only this team's members, or None for everyone.
+        workers (int): Render processes; defaults to the CPU count.
+        progress (callable): Called as progress(done, total) after each render.
+
+    Returns:
+        dict: Invoices created, their number range, total hours and payment,
+            employees skipped for having no rate, and elapsed seconds.
+
+    Raises:
+        RuntimeError: If any invoice failed to render.
+    """
+    started = time.perf_counter()
+    employees = collect_payroll(conn, period_from, period_to, team_id)
+    skipped = [employee[1] for employee in employees if employee[2] is None]
+    employees = [employee for employee in employees if employee[2] is not None]
+    summary = {"invoices": 0, "first_number": None, "last_number": None,
+               "total_hours": 0.0, "total_payment": 0.0, "skipped_no_rate": skipped}
+    if not employees:
+        summary["seconds"] = round(time.perf_counter() - started, 3)
+        return summary
+
+    numbers = allocator.take(conn, len(employees))
+    invoice_date = datetime.now().strftime("%Y-%m-%d")
+    rows = []
+    billed = {}
+
+    # spawn, not fork: the web process has pool, checkpoint and job threads
+    # whose locks must not be copied into the children
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {}
+        for number, (user_id, username_key, rate, timesheet_data, worked_min, entry_ids) in zip(numbers, employees):
+            total_hours = worked_min / 60.0
+            billed[number] = entry_ids
+            future = pool.submit(
+                generate_invoice, number, username_key, company_info, timesheet_data, total_hours, rate
+            )
+            futures[future] = (number, username_key, user_id, total_hours, total_hours * rate)
+
+        for done, future in enumerate(as_completed(futures), 1):
+            number, username_key, user_id, total_hours, total_payment = futures[future]
+            filepath = future.result()
+            if not filepath:
+                pool.shutdown(cancel_futures=True)
+                raise RuntimeError(f"Invoice {number} for {username_key} failed to render")
+            rows.append((number, username_key, username_key, user_id, invoice_date,
+                         total_hours, total_payment, os.path.basename(filepath)))
+            if progress:
+                progress(done, len(futures))
+
+    conn.executemany(
+        "INSERT INTO invoices (invoice_number, username, username_key, user_id, date, "
+        "total_hours, total_payment, filename, sent) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)",
+        sorted(rows)
+    )
+    for number in sorted(billed):
+        bill_time_entries(conn, number, billed[number])
+
+    summary.update(
+        invoices=len(rows),
+        first_number=numbers[0],
+        last_number=numbers[-1],
+        total_hours=round(sum(row[5] for row in rows), 2),
+        total_payment=round(sum(row[6] for row in rows), 2),
+        seconds=round(time.perf_counter() - started, 3),
+    )
+    return summary
@@ -0,0 +1,82 @@
+import threading
+from collections import OrderedDict
+
+
+class ResponseCache:
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        """
+        Bounded LRU cache of rendered pages, keyed on the data they were built from.
+
+        Each entry remembers the data version it was rendered at. A lookup
+        with a different version is a miss and drops the stale entry, so a
+        write anywhere (any worker) invalidates exactly the pages it touched.
+
+        Args:
+            max_entries (int): Most pages kept at once.
+            max_bytes (int): Most body bytes kept at once.
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version):
+        """
+        Return the cached body for ``key`` if it was rendered at ``version``.
+
+        Returns:
+            bytes: The cached body, or None on a miss.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                if entry is not None:
+                    self._drop(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, version, body):
+        """Store a rendered body, evicting least recently used pages as needed."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (version, body)
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached page."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        version, body = self._entries.pop(key)
+        self._bytes -= len(body)
+
+    def stats(self):
+        """
+        Returns:
+            dict: Entry count, bytes held and hit/miss/eviction counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
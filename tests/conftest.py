@@ -0,0 +1,30 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+# The app opens its database and invoice store when it is imported; keep
+# both in a scratch directory, never the real data volume
+DATA_DIR = tempfile.mkdtemp(prefix="timesheet-tests-")
+os.environ["TIMESHEET_DB_PATH"] = os.path.join(DATA_DIR, "timesheet.db")
+os.environ["INVOICE_STORE_DIR"] = os.path.join(DATA_DIR, "invoices")
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    import timesheet_appflask
+    return timesheet_appflask
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
+
+
+@pytest.fixture
+def db(app_module):
+    """A direct connection to the app's database, for seeding rows."""
+    conn = sqlite3.connect(app_module.DB_PATH)
+    yield conn
+    conn.close()
@@ -0,0 +1,39 @@
+import sqlite3
+
+import pytest
+
+from db_handler import OPEN_ENTRIES_SQL, bill_time_entries, insert_time_entry, migrate
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    insert_time_entry(conn, "Jackson Carneiro", "2026-01-05", "08:00", "16:30")
+    insert_time_entry(conn, "Jackson Carneiro", "2026-01-06", "08:00", "12:30")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def open_entry_ids(conn):
+    return [row[0] for row in conn.execute(OPEN_ENTRIES_SQL, ("jacksoncarneiro",))]
+
+
+def test_billed_entries_are_not_billed_again(conn):
+    first = open_entry_ids(conn)
+    assert len(first) == 2
+    bill_time_entries(conn, 1, first)
+    conn.commit()
+    assert open_entry_ids(conn) == []
+
+    insert_time_entry(conn, "Jackson Carneiro", "2026-01-07", "08:00", "16:30")
+    conn.commit()
+    assert len(open_entry_ids(conn)) == 1
+
+
+def test_billing_an_entry_twice_raises(conn):
+    entry_ids = open_entry_ids(conn)
+    bill_time_entries(conn, 1, entry_ids[:1])
+    with pytest.raises(RuntimeError):
+        bill_time_entries(conn, 2, entry_ids)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import threading
+
+import pytest
+
+from db_pool import ConnectionPool
+
+
+@pytest.fixture
+def pool():
+    with tempfile.TemporaryDirectory() as directory:
+        pool = ConnectionPool(os.path.join(directory, "pool.db"), size=2, timeout=0.1)
+        yield pool
+        pool.close_all()
+
+
+def in_thread(function):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["result"] = function()
+        except Exception as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return outcome
+
+
+def test_checkout_is_reentrant_per_thread(pool):
+    conn = pool.checkout()
+    assert pool.checkout() is conn
+    pool.checkin(conn)
+    assert pool.stats()["in_use"] == 1
+    pool.checkin(conn)
+    assert pool.stats()["in_use"] == 0
+
+
+def test_checkin_from_another_thread_is_rejected(pool):
+    conn = pool.checkout()
+    outcome = in_thread(lambda: pool.checkin(conn))
+    assert isinstance(outcome["error"], RuntimeError)
+    assert pool.stats()["in_use"] == 1
+    pool.checkin(conn)
+
+
+def test_detached_connection_is_returned_by_its_new_owner(pool):
+    conn = pool.checkout()
+    pool.detach(conn)
+    # The thread no longer holds it, so it is not handed out again
+    other = pool.checkout()
+    assert other is not conn
+    pool.checkin(other)
+    assert pool.stats()["in_use"] == 1
+
+    assert "error" not in in_thread(lambda: pool.checkin(conn))
+    assert pool.stats()["in_use"] == 0
+    with pytest.raises(RuntimeError):
+        pool.checkin(conn)
@@ -0,0 +1,54 @@
+from db_handler import insert_time_entry
+
+
+def seed_user(db, username, entries):
+    db.execute(
+        "INSERT INTO users (username, username_key, role, rate_per_hour, status) VALUES (?, ?, 'employee', 40, 'active')",
+        (username, username.lower().replace(" ", ""))
+    )
+    for day in range(entries):
+        insert_time_entry(db, username, f"2026-02-{day + 1:02d}", "08:00", "16:30")
+    db.commit()
+
+
+def test_invoice_job_stores_its_pdf_only_after_commit(app_module, db):
+    seed_user(db, "Job Tester", 3)
+    conn = app_module.connect_job_worker()
+    committed = []
+    try:
+        invoice = app_module.run_invoice_job(conn, {"username": "jobtester"}, None, committed.append)
+        # Rendered in memory; nothing reaches the store or the writer yet
+        assert "pdf" not in invoice
+        assert not app_module.invoice_pdf_exists(invoice["filename"])
+        conn.commit()
+        for callback in committed:
+            callback()
+    finally:
+        conn.close()
+
+    assert app_module.invoice_writer.pending(invoice["filename"]) is not None or \
+        app_module.invoice_store.locate(invoice["filename"]) is not None
+    response = app_module.app.test_client().get(f"/download_invoice/{invoice['filename']}")
+    assert response.data.startswith(b"%PDF")
+
+
+def test_rolled_back_invoice_job_reuses_its_render(app_module, db):
+    seed_user(db, "Retry Tester", 2)
+    conn = app_module.connect_job_worker()
+    try:
+        dropped = []
+        first = app_module.run_invoice_job(conn, {"username": "retrytester"}, None, dropped.append)
+        conn.rollback()
+        assert not app_module.invoice_pdf_exists(first["filename"])
+
+        committed = []
+        second = app_module.run_invoice_job(conn, {"username": "retrytester"}, None, committed.append)
+        conn.commit()
+        for callback in committed:
+            callback()
+    finally:
+        conn.close()
+
+    # Same number and bytes as the attempt that never committed
+    assert second == first
+    assert app_module.invoice_pdf_exists(second["filename"])
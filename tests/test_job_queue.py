@@ -0,0 +1,174 @@
+import sqlite3
+import time
+
+import pytest
+
+from db_handler import migrate
+from job_queue import JobQueue
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    conn = sqlite3.connect(path)
+    migrate(conn)
+    conn.close()
+    return path
+
+
+@pytest.fixture
+def conn(db_path):
+    conn = sqlite3.connect(db_path)
+    yield conn
+    conn.close()
+
+
+def make_queue(db_path, handler, **options):
+    return JobQueue(lambda: sqlite3.connect(db_path), {"test": handler}, **options)
+
+
+def run_next(queue, conn):
+    """Claim and run one job the way a worker does; returns the claimed row."""
+    job = queue._claim(conn)
+    if job is not None:
+        queue._run(conn, job)
+    return job
+
+
+def expire_lease(conn, job_id, seconds):
+    with conn:
+        conn.execute("UPDATE jobs SET started_at = started_at - ? WHERE id = ?", (seconds, job_id))
+
+
+def test_workers_run_a_queued_job(db_path, conn):
+    queue = make_queue(db_path, lambda conn, payload, progress, on_commit: {"doubled": payload["n"] * 2},
+                       poll_interval=0.05)
+    job_id, created = queue.enqueue(conn, "test", {"n": 21})
+    assert created
+    queue.start()
+    try:
+        deadline = time.time() + 5
+        while queue.get(conn, job_id)["status"] != "done" and time.time() < deadline:
+            time.sleep(0.02)
+    finally:
+        queue.stop()
+
+    job = queue.get(conn, job_id)
+    assert job["status"] == "done"
+    assert job["attempts"] == 1
+    assert job["result"] == {"doubled": 42}
+
+
+def test_identical_pending_jobs_are_deduplicated(db_path, conn):
+    queue = make_queue(db_path, lambda conn, payload, progress, on_commit: None)
+    first, created = queue.enqueue(conn, "test", {}, "same")
+    again, created_again = queue.enqueue(conn, "test", {}, "same")
+    assert (again, created_again) == (first, False)
+
+    # Once the job finishes the key is free for a new one
+    run_next(queue, conn)
+    later, created_later = queue.enqueue(conn, "test", {}, "same")
+    assert created_later and later != first
+    assert queue.stats(conn)["deduplicated"] == 1
+
+
+def test_expired_lease_is_claimed_again(db_path, conn):
+    queue = make_queue(db_path, lambda conn, payload, progress, on_commit: None, lease=60)
+    job_id, _ = queue.enqueue(conn, "test", {})
+    assert queue._claim(conn)[0] == job_id
+    # Still leased: nobody else may take it
+    assert queue._claim(conn) is None
+
+    expire_lease(conn, job_id, 120)
+    reclaimed = queue._claim(conn)
+    assert reclaimed[0] == job_id
+    assert reclaimed[3] == 2  # attempts
+
+
+def test_reclaim_stops_at_max_attempts(db_path, conn):
+    queue = make_queue(db_path, lambda conn, payload, progress, on_commit: None, max_attempts=2, lease=60)
+    job_id, _ = queue.enqueue(conn, "test", {})
+    queue._claim(conn)
+    expire_lease(conn, job_id, 120)
+    queue._claim(conn)
+    expire_lease(conn, job_id, 120)
+
+    assert queue._claim(conn) is None
+    job = queue.get(conn, job_id)
+    assert job["status"] == "failed"
+    assert job["attempts"] == 2
+
+
+def test_failed_attempts_back_off_until_max_attempts(db_path, conn):
+    def handler(conn, payload, progress, on_commit):
+        on_commit(lambda: committed.append(True))
+        raise RuntimeError("render crashed")
+
+    committed = []
+    queue = make_queue(db_path, handler, max_attempts=3, retry_delay=10)
+    job_id, _ = queue.enqueue(conn, "test", {})
+
+    for attempt, delay in ((1, 10), (2, 20)):
+        before = time.time()
+        run_next(queue, conn)
+        job = queue.get(conn, job_id)
+        assert (job["status"], job["attempts"], job["error"]) == ("queued", attempt, "render crashed")
+        run_after = conn.execute("SELECT run_after FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        assert before + delay <= run_after <= time.time() + delay
+        # Not due yet
+        assert queue._claim(conn) is None
+        with conn:
+            conn.execute("UPDATE jobs SET run_after = 0 WHERE id = ?", (job_id,))
+
+    run_next(queue, conn)
+    assert queue.get(conn, job_id)["status"] == "failed"
+    assert committed == []
+
+
+def test_value_error_fails_at_once(db_path, conn):
+    def handler(conn, payload, progress, on_commit):
+        raise ValueError("nothing to bill")
+
+    queue = make_queue(db_path, handler)
+    job_id, _ = queue.enqueue(conn, "test", {})
+    run_next(queue, conn)
+    job = queue.get(conn, job_id)
+    assert (job["status"], job["attempts"], job["error"]) == ("failed", 1, "nothing to bill")
+
+
+def test_progress_renews_the_lease(db_path, conn):
+    def handler(job_conn, payload, progress, on_commit):
+        expire_lease(conn, job_id, 120)
+        progress(1, 2)
+        # Reported progress keeps another worker from taking the job
+        assert queue._claim(conn) is None
+        return "ok"
+
+    queue = make_queue(db_path, handler, lease=60)
+    job_id, _ = queue.enqueue(conn, "test", {})
+    worker = sqlite3.connect(db_path)
+    try:
+        run_next(queue, worker)
+    finally:
+        worker.close()
+
+    job = queue.get(conn, job_id)
+    assert job["status"] == "done"
+    assert job["progress"] == {"done": 1, "total": 2}
+
+
+def test_commit_callbacks_run_after_the_job_is_done(db_path, conn):
+    seen = []
+
+    def handler(conn, payload, progress, on_commit):
+        on_commit(lambda: seen.append(queue.get(observer, job_id)["status"]))
+        return None
+
+    queue = make_queue(db_path, handler)
+    job_id, _ = queue.enqueue(conn, "test", {})
+    observer = sqlite3.connect(db_path)
+    try:
+        run_next(queue, conn)
+    finally:
+        observer.close()
+    assert seen == ["done"]
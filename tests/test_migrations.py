@@ -0,0 +1,71 @@
+import sqlite3
+
+import pytest
+
+import db_handler
+from db_handler import SCHEMA_VERSION, _create_baseline_tables, migrate
+
+
+class CrashingConnection(sqlite3.Connection):
+    """Dies on a given commit, leaving that transaction uncommitted."""
+    commits_left = None
+
+    def commit(self):
+        if self.commits_left is not None:
+            if self.commits_left == 0:
+                raise KeyboardInterrupt("killed mid-migration")
+            self.commits_left -= 1
+        super().commit()
+
+
+@pytest.fixture
+def legacy_db(tmp_path):
+    """A version 0 database laid out like production before any migration."""
+    path = str(tmp_path / "legacy.db")
+    conn = sqlite3.connect(path)
+    _create_baseline_tables(conn)
+    conn.execute("INSERT INTO users (username, role, rate_per_hour) VALUES ('Jackson Carneiro', 'employee', 40)")
+    conn.executemany(
+        "INSERT INTO time_entries (date, start_time, end_time, username) VALUES (?, '08:00', '16:30', 'Jackson Carneiro')",
+        [(f"2025-01-{day:02d}",) for day in range(1, 29)] + [(f"2025-02-{day:02d}",) for day in range(1, 23)]
+    )
+    conn.execute(
+        "INSERT INTO invoices (invoice_number, username, date, total_hours, total_payment, filename) "
+        "VALUES (1, 'Jackson Carneiro', '2025-01-31', 224, 8960, 'Invoice_1_jacksoncarneiro.pdf')"
+    )
+    conn.commit()
+    conn.close()
+    return path
+
+
+def test_interrupted_backfill_resumes_on_the_next_start(legacy_db, monkeypatch):
+    run_backfill = db_handler.run_backfill
+    monkeypatch.setattr(db_handler, "run_backfill",
+                        lambda conn, table, assignments, where: run_backfill(conn, table, assignments, where, 10))
+
+    conn = sqlite3.connect(legacy_db, factory=CrashingConnection)
+    # The schema steps, the users backfill and three of the five
+    # time_entries chunks commit; the fourth chunk never does
+    conn.commits_left = 5
+    with pytest.raises(KeyboardInterrupt):
+        migrate(conn)
+    conn.close()
+
+    conn = sqlite3.connect(legacy_db)
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == 0
+    assert conn.execute(
+        "SELECT COUNT(*), COUNT(username_key) FROM time_entries"
+    ).fetchone() == (50, 30)
+
+    assert migrate(conn) == SCHEMA_VERSION
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+    assert conn.execute(
+        "SELECT COUNT(*) FROM time_entries "
+        "WHERE username_key IS NULL OR user_id IS NULL OR worked_min IS NULL"
+    ).fetchone()[0] == 0
+    assert conn.execute("SELECT DISTINCT worked_min FROM time_entries").fetchall() == [(480,)]
+    # January was billed by the invoice dated after it; February is open
+    assert conn.execute(
+        "SELECT invoice_number, COUNT(*) FROM time_entries GROUP BY invoice_number ORDER BY invoice_number"
+    ).fetchall() == [(None, 22), (1, 28)]
+    conn.close()
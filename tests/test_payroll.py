@@ -0,0 +1,27 @@
+import sqlite3
+
+import pytest
+
+from db_handler import insert_time_entry, migrate
+from payroll import collect_payroll
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    for username, status in (("Active Crew", "active"), ("Left Crew", "inactive"), ("New Crew", None)):
+        conn.execute(
+            "INSERT INTO users (username, username_key, role, rate_per_hour, status) VALUES (?, ?, 'employee', 40, ?)",
+            (username, username.lower().replace(" ", ""), status)
+        )
+        insert_time_entry(conn, username, "2026-03-02", "08:00", "16:30")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_payroll_skips_inactive_employees(conn):
+    employees = collect_payroll(conn, "2026-03-01", "2026-03-31")
+    # Accounts registered without a status still count as active
+    assert [employee[1] for employee in employees] == ["activecrew", "newcrew"]
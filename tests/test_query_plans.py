@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from db_handler import find_table_scans, migrate
+
+
+@pytest.fixture
+def conn():
+    with tempfile.TemporaryDirectory() as directory:
+        conn = sqlite3.connect(os.path.join(directory, "timesheet.db"))
+        migrate(conn)
+        yield conn
+        conn.close()
+
+
+def test_hot_queries_use_indexes_after_migrate(conn):
+    assert find_table_scans(conn) == []
+
+
+@pytest.mark.parametrize("sql", [
+    # Full table scan
+    "SELECT id FROM time_entries WHERE start_time = '08:00'",
+    # Whole index read, no LIMIT to stop it
+    "SELECT date FROM time_entries ORDER BY date DESC",
+    # LIMIT, but every row is sorted first
+    "SELECT id FROM time_entries ORDER BY start_time LIMIT 10",
+])
+def test_scans_are_flagged(conn, sql):
+    assert find_table_scans(conn, [("query", sql, ())]) != []
+
+
+def test_ordered_index_walk_cut_short_by_limit_is_allowed(conn):
+    sql = "SELECT id, date FROM time_entries ORDER BY date DESC, id DESC LIMIT 51"
+    assert find_table_scans(conn, [("query", sql, ())]) == []
+
+
+def test_hot_queries_use_indexes_with_statistics(conn):
+    # With sqlite_stat1 filled in the planner weighs table sizes, and a tiny
+    # team_members table tempts it into starting from the team
+    for crew in range(5):
+        conn.execute("INSERT INTO teams (name) VALUES (?)", (f"Crew {crew}",))
+    for number in range(20):
+        username = f"employee{number}"
+        user_id = conn.execute(
+            "INSERT INTO users (username, username_key, role) VALUES (?, ?, 'employee')", (username, username)
+        ).lastrowid
+        conn.execute("INSERT INTO team_members (user_id, team_id) VALUES (?, ?)", (user_id, number % 5 + 1))
+        for day in range(1, 29):
+            conn.execute(
+                "INSERT INTO time_entries (username, username_key, user_id, date, start_time, end_time, worked_min) "
+                "VALUES (?, ?, ?, ?, '08:00', '16:30', 480)", (username, username, user_id, f"2026-01-{day:02d}")
+            )
+        conn.execute(
+            "INSERT INTO invoices (username, username_key, user_id, date, total_hours, total_payment, filename, sent) "
+            "VALUES (?, ?, ?, '2026-01-31', 224, 8960, 'x.pdf', 0)", (username, username, user_id)
+        )
+    conn.commit()
+    conn.execute("ANALYZE")
+    assert find_table_scans(conn) == []
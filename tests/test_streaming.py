@@ -0,0 +1,53 @@
+from db_handler import insert_time_entry
+
+
+def seed_entries(db, username, count):
+    for day in range(count):
+        insert_time_entry(db, username, f"2025-{day % 12 + 1:02d}-{day % 28 + 1:02d}", "08:00", "16:30")
+    db.commit()
+
+
+def test_csv_export_keeps_its_connection_until_closed(app_module, client, db):
+    seed_entries(db, "Export Tester", 3000)
+    pool = app_module.db_pool
+
+    response = client.get("/export/time_entries.csv?employee=exporttester", buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    assert first.startswith(b"id,date,employee")
+    # Streaming: the body still owns a connection, and nobody else gets it
+    assert pool.stats()["in_use"] == 1
+    other = pool.checkout()
+    try:
+        other.execute("INSERT INTO time_entries (username, username_key, date) VALUES ('ghost', 'ghost', '2025-01-01')")
+        body = first + b"".join(chunks)
+    finally:
+        pool.checkin(other)
+    response.close()
+
+    assert b"ghost" not in body
+    assert body.count(b"\n") == 3001
+    assert pool.stats()["in_use"] == 0
+
+
+def test_employee_dashboard_keeps_its_connection_until_closed(app_module, client, db):
+    seed_entries(db, "Dashboard Tester", 3000)
+    pool = app_module.db_pool
+
+    response = client.get("/employee_dashboard/dashboardtester", buffered=False)
+    chunks = iter(response.response)
+    first = next(chunks)
+    assert pool.stats()["in_use"] == 1
+    other = pool.checkout()
+    try:
+        other.execute(
+            "INSERT INTO time_entries (username, username_key, date, start_time, end_time) "
+            "VALUES ('dashboardtester', 'dashboardtester', '2099-12-31', '01:23', '04:56')"
+        )
+        body = first + b"".join(chunks)
+    finally:
+        pool.checkin(other)
+    response.close()
+
+    assert b"2099-12-31" not in body
+    assert pool.stats()["in_use"] == 0
@@ -0,0 +1,40 @@
+import sqlite3
+
+import pytest
+
+from db_handler import bulk_insert_time_entries, migrate
+
+
+@pytest.fixture
+def conn():
+    conn = sqlite3.connect(":memory:")
+    migrate(conn)
+    conn.execute("INSERT INTO users (username, username_key, role) VALUES ('Jackson Carneiro', 'jacksoncarneiro', 'employee')")
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def test_bulk_insert_reports_bad_rows_and_keeps_good_ones(conn):
+    results = bulk_insert_time_entries(conn, [
+        ("jacksoncarneiro", "2026-01-05", "08:00", "16:30"),
+        ("jacksoncarneiro", "2026-01-06", 800, "16:30"),
+        ("jacksoncarneiro", "2026-01-07", "8am", "16:30"),
+        ("nobody", "2026-01-08", "08:00", "16:30"),
+    ])
+    assert [result["ok"] for result in results] == [True, False, False, False]
+    assert "strings" in results[1]["error"]
+    assert conn.execute("SELECT COUNT(*) FROM time_entries").fetchone()[0] == 1
+
+
+def test_bulk_route_rejects_non_string_times(client):
+    response = client.post("/time_entries/bulk", json={
+        "employees": {"nobody": {"2026-01-05": {"start_time": 800, "end_time": "16:30"}}}
+    })
+    assert response.status_code != 500
+    assert response.json["results"][0] == {"ok": False, "error": "Employee, date and times must be strings",
+                                           "username": "nobody", "date": "2026-01-05"}
+
+
+def test_bulk_route_rejects_non_object_body(client):
+    assert client.post("/time_entries/bulk", json=[1, 2]).status_code == 400
@@ -0,0 +1,54 @@
+import time
+
+from db_handler import insert_time_entry
+
+URL = "/employee_invoices/versiontester"
+
+
+def set_updated_at(db, stamp):
+    """Pretend the last change to the test user happened at ``stamp``."""
+    db.execute("UPDATE data_versions SET updated_at = ? WHERE scope = 'user:versiontester'", (stamp,))
+    db.commit()
+
+
+def test_etag_revalidation(client, db):
+    insert_time_entry(db, "Version Tester", "2026-04-01", "08:00", "16:30")
+    db.commit()
+
+    first = client.get(URL)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert first.headers["Cache-Control"] == "private, no-cache"
+
+    unchanged = client.get(URL, headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304
+    assert unchanged.headers["ETag"] == etag
+    assert unchanged.data == b""
+
+    insert_time_entry(db, "Version Tester", "2026-04-02", "08:00", "16:30")
+    db.commit()
+    changed = client.get(URL, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_last_modified_waits_for_the_second_to_pass(client, db):
+    insert_time_entry(db, "Version Tester", "2026-04-03", "08:00", "16:30")
+    db.commit()
+    # Changed in the current second: another write could still follow within it
+    set_updated_at(db, int(time.time()) + 1)
+    assert "Last-Modified" not in client.get(URL).headers
+
+    set_updated_at(db, int(time.time()) - 10)
+    response = client.get(URL)
+    last_modified = response.headers["Last-Modified"]
+
+    unchanged = client.get(URL, headers={"If-Modified-Since": last_modified})
+    assert unchanged.status_code == 304
+
+    insert_time_entry(db, "Version Tester", "2026-04-04", "08:00", "16:30")
+    db.commit()
+    set_updated_at(db, int(time.time()) + 1)
+    changed = client.get(URL, headers={"If-Modified-Since": last_modified})
+    assert changed.status_code == 200
+    assert "Last-Modified" not in changed.headers
@@ -0,0 +1,69 @@
+import io
+import zipfile
+
+import pytest
+
+from zip_stream import stream_zip
+
+
+def read_archive(chunks):
+    archive = zipfile.ZipFile(io.BytesIO(b"".join(chunks)))
+    assert archive.testzip() is None
+    return archive
+
+
+def test_archive_streams_in_chunks_and_is_valid(tmp_path):
+    stored = tmp_path / "stored.pdf"
+    stored.write_bytes(b"%PDF-stored" * 1000)
+    held = b"%PDF-held" * 500
+
+    chunks = list(stream_zip([("stored.pdf", str(stored)), ("held.pdf", held)], chunk_bytes=1024))
+
+    assert len(chunks) > 1
+    archive = read_archive(chunks)
+    assert archive.namelist() == ["stored.pdf", "held.pdf"]
+    assert archive.read("stored.pdf") == stored.read_bytes()
+    assert archive.read("held.pdf") == held
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+
+
+def test_missing_file_is_reported_and_left_out(tmp_path):
+    present = tmp_path / "present.pdf"
+    present.write_bytes(b"%PDF-present")
+    gone = str(tmp_path / "gone.pdf")
+    reported = []
+
+    chunks = list(stream_zip([("gone.pdf", gone), ("present.pdf", str(present))],
+                             on_missing=lambda arcname, path: reported.append((arcname, path))))
+
+    assert reported == [("gone.pdf", gone)]
+    assert read_archive(chunks).namelist() == ["present.pdf"]
+
+    with pytest.raises(FileNotFoundError):
+        list(stream_zip([("gone.pdf", gone)]))
+
+
+def test_bundle_holds_stored_and_pending_pdfs_and_lists_missing_ones(app_module, client, db, monkeypatch):
+    rows = [(9101, "Invoice_9101_bundletester.pdf"), (9102, "Invoice_9102_bundletester.pdf"),
+            (9103, "Invoice_9103_bundletester.pdf")]
+    db.executemany(
+        "INSERT INTO invoices (invoice_number, username, username_key, date, total_hours, total_payment, filename) "
+        "VALUES (?, 'bundletester', 'bundletester', '2026-05-01', 8, 320, ?)",
+        rows
+    )
+    db.commit()
+    app_module.invoice_store.write(9101, rows[0][1], b"%PDF-on-disk")
+    # 9102 is still waiting in the background writer; 9103 was never stored
+    pending = app_module.invoice_writer.pending
+    monkeypatch.setattr(app_module.invoice_writer, "pending",
+                        lambda filename: b"%PDF-in-memory" if filename == rows[1][1] else pending(filename))
+
+    response = client.get("/invoices/bundle.zip?employee=bundletester")
+    assert response.status_code == 200
+    assert response.mimetype == "application/zip"
+
+    archive = read_archive([response.data])
+    assert archive.namelist() == [rows[0][1], rows[1][1], "MISSING.txt"]
+    assert archive.read(rows[0][1]) == b"%PDF-on-disk"
+    assert archive.read(rows[1][1]) == b"%PDF-in-memory"
+    assert archive.read("MISSING.txt").decode().splitlines() == ["invoice_number\tfilename", f"9103\t{rows[2][1]}"]
@@ -1,15 +1,45 @@
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, send_from_directory, abort
+from flask import Flask, after_this_request, render_template, stream_template, stream_with_context, request, redirect, url_for, jsonify, send_file, abort, g
 import sqlite3
 import os
-from datetime import datetime, timedelta
-from invoice_generator import generate_invoice
-from db_handler import Database
+import csv
+import io
+import click
+import tempfile
+import time
+from functools import wraps
+from datetime import datetime, timezone
+from invoice_generator import INVOICE_TEMPLATE_VERSION, LOGO_PATH, InvoiceRenderContext, generate_invoice
+from invoice_cache import InvoiceRenderCache
+from invoice_store import InvoiceStore
+from invoice_writer import InvoiceWriter
+from db_handler import (
+    ADMIN_ENTRIES_SQL, ADMIN_INVOICES_SQL, INVOICE_BUNDLE_SQL, LATEST_INVOICE_SQL, LATEST_UNSENT_INVOICE_SQL,
+    LOGIN_SQL, OPEN_ENTRIES_SQL, USER_ENTRIES_SQL, USER_INVOICES_SQL, USER_RATE_SQL, WEEKLY_HOURS_SQL,
+    Database, DB_PATH, InvoiceNumberAllocator, TeamCache, WalCheckpointer, assign_team, configure_connection,
+    data_version_stamp, enable_wal, filter_clauses, filtered_query, find_table_scans,
+    bill_time_entries, bulk_insert_time_entries, check_hour_aggregates, insert_time_entry, migrate, normalize_username,
+    rebuild_hour_aggregates,
+)
+from compression import ResponseCompressor
+from db_pool import ConnectionPool
+from job_queue import JobQueue
+from payroll import run_payroll
+from response_cache import ResponseCache
+from zip_stream import stream_zip
 
 
 app = Flask(__name__)
 
+# Payroll render processes are spawned, and re-import this file as
+# __mp_main__ when it was started as a script; they only call
+# generate_invoice, so the start-up work below is skipped in them
+RENDER_PROCESS = __name__ == '__mp_main__'
+
+# Invoice PDFs, sharded under the persistent data directory
+invoice_store = InvoiceStore()
+
 def ensure_invoice_directory():
-    directory = "/tmp/invoices"
+    directory = invoice_store.root
     if not os.path.exists(directory):
         os.makedirs(directory, exist_ok=True)
         print(f"Invoice directory created: {directory}")
@@ -17,13 +47,49 @@ def ensure_invoice_directory():
         print(f"Invoice directory already exists: {directory}")
 
 # Call the function to ensure the directory exists
-ensure_invoice_directory()
+if not RENDER_PROCESS:
+    ensure_invoice_directory()
+
+
+# Connection pool sizing (per gunicorn worker process)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+
+# Rendered dashboard pages kept in memory per worker
+RESPONSE_CACHE_ENTRIES = int(os.environ.get("RESPONSE_CACHE_ENTRIES", "256"))
+RESPONSE_CACHE_BYTES = int(os.environ.get("RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+# Larger streamed pages go straight to the client without being kept
+RESPONSE_CACHE_PAGE_BYTES = int(os.environ.get("RESPONSE_CACHE_PAGE_BYTES", str(1024 * 1024)))
+
+# Text responses are compressed from this size up, at these levels
+COMPRESS_MIN_BYTES = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+COMPRESS_GZIP_LEVEL = int(os.environ.get("COMPRESS_GZIP_LEVEL", "6"))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get("COMPRESS_BROTLI_QUALITY", "4"))
+
+# Bytes gathered from a streamed template before each write to the client
+STREAM_CHUNK_BYTES = 16 * 1024
+
+# Background invoice render workers per process, and their retry policy
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_DELAY = float(os.environ.get("JOB_RETRY_DELAY", "5"))
+
+# Processes rendering invoices during a payroll run (default: one per CPU)
+PAYROLL_WORKERS = int(os.environ.get("PAYROLL_WORKERS", "0")) or None
+
+# Input hashes of rendered invoices remembered per worker
+INVOICE_CACHE_ENTRIES = int(os.environ.get("INVOICE_CACHE_ENTRIES", "1024"))
+
+# Threads writing PDFs rendered in memory to disk after they were sent
+INVOICE_WRITERS = int(os.environ.get("INVOICE_WRITERS", "1"))
+
+# Invoice numbers reserved per database round-trip in each worker
+INVOICE_NUMBER_BLOCK = int(os.environ.get("INVOICE_NUMBER_BLOCK", "1"))
 
 
 # Initialize the database and create tables if they don't exist
 def initialize_db():
-    # Define the persistent database path
-    db_path = "/var/data/timesheet.db"
+    db_path = DB_PATH
 
     try:
         # Ensure the directory for the database exists
@@ -31,45 +97,11 @@ def initialize_db():
 
         # Connect to the database
         conn = sqlite3.connect(db_path, check_same_thread=False)
-        cursor = conn.cursor()
+        enable_wal(conn)
+
+        # Create or upgrade the tables
+        migrate(conn)
 
-        # Create the users table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                username TEXT PRIMARY KEY,
-                password TEXT NOT NULL,
-                role TEXT NOT NULL,
-                phone_number TEXT
-            )
-        ''')
-
-        # Create the time_entries table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS time_entries (
-                username TEXT,
-                date TEXT,
-                start_time TEXT,
-                end_time TEXT,
-                FOREIGN KEY (username) REFERENCES users (username)
-            )
-        ''')
-
-        # Create the invoices table if it doesn't exist
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS invoices (
-                invoice_number INTEGER PRIMARY KEY,
-                username TEXT NOT NULL,
-                date TEXT NOT NULL,
-                total_hours REAL NOT NULL,
-                total_payment REAL NOT NULL,
-                filename TEXT NOT NULL,
-                sent INTEGER DEFAULT 0,
-                FOREIGN KEY (username) REFERENCES users (username)
-            )
-        ''')
-
-        # Commit the changes and close the connection
-        conn.commit()
         print(f"Database initialized successfully at: {db_path}")
 
     except sqlite3.Error as e:
@@ -85,7 +117,194 @@ def initialize_db():
             conn.close()
 
 # Call the function to initialize the database
-initialize_db()
+if not RENDER_PROCESS:
+    initialize_db()
+
+
+def configure_pooled_connection(conn):
+    """Apply per-connection settings once, when the pool opens a physical connection."""
+    # Checkpoints are left to the background checkpointer below
+    configure_connection(conn, autocheckpoint=False)
+
+
+db_pool = ConnectionPool(DB_PATH, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, on_connect=configure_pooled_connection)
+
+team_cache = TeamCache()
+
+page_cache = ResponseCache(RESPONSE_CACHE_ENTRIES, RESPONSE_CACHE_BYTES)
+
+compressor = ResponseCompressor(COMPRESS_MIN_BYTES, COMPRESS_GZIP_LEVEL, COMPRESS_BROTLI_QUALITY)
+
+
+def stream_chunks(chunks, key=None, version=None):
+    """
+    Coalesce a streamed template into STREAM_CHUNK_BYTES writes.
+
+    Template streams yield many tiny strings; grouping them keeps the number
+    of socket writes low. With a ``key`` the page is also kept in page_cache
+    once it has streamed out completely, unless it grew past
+    RESPONSE_CACHE_PAGE_BYTES, in which case collecting stops so memory per
+    request stays bounded.
+
+    Args:
+        chunks (iterable): The str chunks of the streamed body.
+        key (str): page_cache key, or None to skip caching.
+        version (tuple): data_versions the page was rendered at.
+    """
+    kept = [] if key is not None else None
+    kept_bytes = 0
+    buffer, buffered = [], 0
+    for chunk in chunks:
+        if isinstance(chunk, str):
+            chunk = chunk.encode()
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= STREAM_CHUNK_BYTES:
+            data = b''.join(buffer)
+            buffer, buffered = [], 0
+            if kept is not None:
+                kept_bytes += len(data)
+                if kept_bytes > RESPONSE_CACHE_PAGE_BYTES:
+                    kept = None
+                else:
+                    kept.append(data)
+            yield data
+    data = b''.join(buffer)
+    if data:
+        yield data
+    if kept is not None:
+        kept.append(data)
+        page_cache.put(key, version, b''.join(kept))
+
+
+def versioned_page(scopes, cache=True):
+    """
+    Tag a GET view with an ETag and Last-Modified taken from its data scopes.
+
+    A request whose If-None-Match (or If-Modified-Since) still matches gets
+    a 304 before the view runs, so nothing is queried, rendered or
+    serialized. HTML views can also be served from page_cache until one of
+    their scopes changes.
+
+    Args:
+        scopes (callable): Called with the connection and the view arguments;
+            returns the data_versions scopes the response is built from.
+        cache (bool): Keep rendered string bodies in page_cache.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            conn = get_db_connection()
+            version, updated_at = data_version_stamp(conn, scopes(conn, **kwargs))
+            etag = f"{request.endpoint}-{'.'.join(map(str, version))}"
+            # updated_at has one-second resolution: a Last-Modified for the
+            # current second could hide a later write in that same second, so
+            # it is only sent once the second is over (the ETag still is)
+            if updated_at and updated_at < int(time.time()):
+                last_modified = datetime.fromtimestamp(updated_at, timezone.utc)
+            else:
+                last_modified = None
+
+            if request.if_none_match:
+                not_modified = any(
+                    request.if_none_match.contains(variant) for variant in compressor.etag_variants(etag)
+                )
+            else:
+                not_modified = bool(
+                    last_modified and request.if_modified_since
+                    and last_modified <= request.if_modified_since
+                )
+
+            if not_modified:
+                response = app.response_class(status=304)
+            else:
+                key = request.full_path
+                body = page_cache.get(key, version) if cache else None
+                if body is None:
+                    rv = view(**kwargs)
+                    if not isinstance(rv, str):
+                        # Errors, redirects and JSON responses are not cached;
+                        # only successful ones carry validators
+                        response = app.make_response(rv)
+                        if response.status_code != 200:
+                            return response
+                        if response.is_streamed:
+                            response.response = stream_chunks(
+                                response.response, key if cache else None, version
+                            )
+                    else:
+                        body = rv.encode()
+                        if cache:
+                            page_cache.put(key, version, body)
+                if body is not None:
+                    response = app.response_class(body, mimetype='text/html')
+
+            response.set_etag(etag)
+            if last_modified:
+                response.last_modified = last_modified
+            # Let browsers keep the body but always revalidate it
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            return response
+        return wrapper
+    return decorator
+
+wal_checkpointer = WalCheckpointer(DB_PATH)
+if not RENDER_PROCESS:
+    wal_checkpointer.start()
+
+invoice_numbers = InvoiceNumberAllocator(INVOICE_NUMBER_BLOCK)
+
+invoice_cache = InvoiceRenderCache(invoice_store, INVOICE_CACHE_ENTRIES)
+
+invoice_writer = InvoiceWriter(invoice_store, INVOICE_WRITERS)
+
+
+def get_db_connection():
+    """Return the pooled connection bound to the current request."""
+    if 'db' not in g:
+        g.db = db_pool.checkout()
+    return g.db
+
+
+def stream_db_connection():
+    """
+    Hand the request's connection over to a streamed response body.
+
+    teardown_appcontext checks g.db back in as soon as the view returns,
+    before a streamed body is read, so a body still reading from it would
+    share it with the next request to check it out. Streaming views call
+    this instead of get_db_connection(): the connection leaves g and this
+    thread, and goes back to the pool only when the response is closed,
+    after its last chunk was sent or the client went away.
+
+    Returns:
+        sqlite3.Connection: A connection owned by the response.
+    """
+    conn = g.pop('db', None) or db_pool.checkout()
+    db_pool.detach(conn)
+
+    @after_this_request
+    def release_with_response(response):
+        response.call_on_close(lambda: db_pool.checkin(conn))
+        return response
+
+    return conn
+
+
+@app.after_request
+def compress_response(response):
+    """gzip or brotli text responses for clients that accept it."""
+    return compressor.compress(request, response)
+
+
+@app.teardown_appcontext
+def release_db_connection(exception):
+    """Hand the request's connection back to the pool."""
+    conn = g.pop('db', None)
+    if conn is not None:
+        db_pool.checkin(conn)
+
 
 @app.route('/')
 def home():
@@ -95,16 +314,14 @@ def home():
 @app.route('/login', methods=['POST'])
 def login():
     try:
-        username = request.form.get('username').strip().lower().replace(" ", "")
+        username = normalize_username(request.form.get('username').strip())
         password = request.form.get('password')
 
         if not username or not password:
             return jsonify({'message': 'Username and password are required'}), 400
 
         conn = get_db_connection()
-        query = "SELECT role FROM users WHERE LOWER(REPLACE(username, ' ', '')) = ? AND password = ?"
-        user = conn.execute(query, (username, password)).fetchone()
-        conn.close()
+        user = conn.execute(LOGIN_SQL, (username, password)).fetchone()
 
         if user:
             role = user['role']
@@ -122,74 +339,368 @@ def login():
 
 
 
-def get_db_connection():
-    # Ensure the persistent directory is correctly specified
-    db_path = '/var/data/timesheet.db'
+# Rows per admin dashboard page, and the most a client may ask for
+ADMIN_PAGE_SIZE = 50
+ADMIN_MAX_PAGE_SIZE = 500
 
-    # Check if the database file exists
-    if not os.path.exists(db_path):
-        raise FileNotFoundError(f"Database file not found at {db_path}")
 
-    # Connect to the SQLite database
-    conn = sqlite3.connect(db_path, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
-    return conn
+def parse_cursor(value):
+    """Split a "<date>|<id>" keyset cursor; None when absent or malformed."""
+    if not value:
+        return None
+    date, _, row_id = value.rpartition('|')
+    if not date or not row_id.isdigit():
+        return None
+    return date, int(row_id)
+
+
+def admin_filters(args):
+    """Read the team, employee, date-range and page-size filters from the query string."""
+    try:
+        page_size = int(args.get('page_size', ADMIN_PAGE_SIZE))
+    except ValueError:
+        page_size = ADMIN_PAGE_SIZE
+    return {
+        'team': args.get('team', ''),
+        'employee': normalize_username(args.get('employee', '')),
+        'from': args.get('from', ''),
+        'to': args.get('to', ''),
+        'page_size': max(1, min(page_size, ADMIN_MAX_PAGE_SIZE)),
+    }
+
+
+class KeysetPage:
+    def __init__(self, rows, page_size, key_column, shape, link):
+        """
+        One keyset page of rows, ready before the template starts streaming.
+
+        The query fetches ``page_size + 1`` rows; the extra row only tells
+        whether an older page exists. Rows are read in full up front so no
+        cursor (and no read snapshot) stays open while a slow client reads.
+
+        Args:
+            rows (list): The fetched rows of the page query.
+            page_size (int): Rows to yield.
+            key_column (str): Tie-breaker column after ``date`` in the rows.
+            shape (callable): Turns a row into what the template renders.
+            link (callable): Builds the URL of the next page from its cursor.
+        """
+        self.rows = rows[:page_size]
+        self.shape = shape
+        self.link = link
+        self.next_cursor = None
+        if len(rows) > page_size:
+            last = self.rows[-1]
+            self.next_cursor = f"{last['date']}|{last[key_column]}"
+
+    def __iter__(self):
+        for row in self.rows:
+            yield self.shape(row)
+
+    @property
+    def next_url(self):
+        return self.next_cursor and self.link(self.next_cursor)
+
+
+def fetch_page(conn, sql, clauses, params, alias, key_column, cursor, page_size, shape, link):
+    """
+    Run one keyset page of ``sql``, newest first by (date, key_column).
+
+    Returns:
+        KeysetPage: The page's rows.
+    """
+    rows = conn.execute(*filtered_query(sql, clauses, params, alias, key_column, cursor, page_size + 1)).fetchall()
+    return KeysetPage(rows, page_size, key_column, shape, link)
+
+
+def display_name(username):
+    """Title-case a stored username and collapse its whitespace."""
+    return ' '.join(username.strip().title().split())
+
+
+def admin_dashboard_scopes(conn):
+    """Data scopes behind an admin dashboard page: its filter target plus roster and teams."""
+    filters = admin_filters(request.args)
+    if filters['employee']:
+        scope = f"user:{filters['employee']}"
+    elif filters['team']:
+        team = team_cache.teams(conn).get(filters['team'])
+        scope = f"team:{team['id']}" if team else 'teams'
+    else:
+        scope = 'all'
+    return ('teams', 'users', scope)
 
 
-        
 @app.route('/admin_dashboard')
+@versioned_page(admin_dashboard_scopes)
 def admin_dashboard():
     conn = get_db_connection()
-    teams = {
-        "Team 1 - Jackson C & Lucas C": ["Jackson Carneiro", "Lucas Cabral"],
-        "Team 2 - Bruno V & Thallys C": ["Bruno Vianello", "Thallys Carvalho"],
-        "Team 3 - Michel S & Giulliano C": ["Michel Silva", "Giulliano Cabral"],
-        "Team 4 - Pedro C & Caio H": ["Pedro Cadenas", "Caio Henrique"],
-    }
+    filters = admin_filters(request.args)
+    teams = team_cache.teams(conn)
+    team_id = teams[filters['team']]['id'] if filters['team'] in teams else None
+
+    # Employees with their team, resolved in one JOIN
+    employees = conn.execute(
+        'SELECT u.username, u.username_key, u.role, t.name AS team FROM users u '
+        'LEFT JOIN team_members tm ON tm.user_id = u.id '
+        'LEFT JOIN teams t ON t.id = tm.team_id '
+        'WHERE u.role = "employee" ORDER BY t.name, u.username'
+    ).fetchall()
 
-    conn.row_factory = sqlite3.Row
-    employees = conn.execute('SELECT * FROM users WHERE role = "employee"').fetchall()
-    entries = conn.execute('SELECT * FROM time_entries').fetchall()
-    invoices = conn.execute('SELECT * FROM invoices').fetchall()
-    conn.close()
+    # Paging links keep the current filters and the other table's position
+    query = {key: value for key, value in request.args.items() if value}
 
-    employee_list = []
-    for team_name, team_members in teams.items():
-        for member in team_members:
-            employee_data = next((emp for emp in employees if emp['username'].strip().title() == member), None)
-            employee_list.append({
-                'username': member,
-                'team': team_name,
-                'role': employee_data['role'] if employee_data else None
-            })
-
-    entry_list = []
-    for entry in entries:
-        entry_data = {
-            'username': ' '.join(entry['username'].strip().title().split()),
+    clauses, params = filter_clauses(filters, 'te', team_id, paged=True)
+    entries = fetch_page(
+        conn, ADMIN_ENTRIES_SQL, clauses, params, 'te', 'id', parse_cursor(request.args.get('after')), filters['page_size'],
+        lambda entry: {
+            'username': display_name(entry['username']),
             'date': entry['date'],
             'start_time': entry['start_time'],
             'end_time': entry['end_time'],
-            'total_hours': round(
-                (datetime.strptime(entry['end_time'], "%H:%M") - datetime.strptime(entry['start_time'], "%H:%M") - timedelta(minutes=30)).seconds / 3600.0, 2
-            ),
-            'team': next((team for team, members in teams.items() if entry['username'].strip().title() in members), None)
-        }
-        entry_list.append(entry_data)
-
-    invoice_list = []
-    for invoice in invoices:
-        invoice_data = {
+            'total_hours': entry['total_hours'],
+            'team': entry['team']
+        },
+        lambda after: url_for('admin_dashboard', **{**query, 'after': after})
+    )
+    clauses, params = filter_clauses(filters, 'inv', team_id, paged=True)
+    invoices = fetch_page(
+        conn, ADMIN_INVOICES_SQL, clauses, params, 'inv', 'invoice_number', parse_cursor(request.args.get('inv_after')), filters['page_size'],
+        lambda invoice: {
             'invoice_number': invoice['invoice_number'],
-            'username': ' '.join(invoice['username'].strip().title().split()),
+            'username': display_name(invoice['username']),
             'date': invoice['date'],
             'total_hours': invoice['total_hours'],
             'total_payment': invoice['total_payment'],
             'filename': invoice['filename']
-        }
-        invoice_list.append(invoice_data)
+        },
+        lambda after: url_for('admin_dashboard', **{**query, 'inv_after': after})
+    )
+
+    employee_list = []
+    for employee in employees:
+        employee_list.append({
+            'username': ' '.join(employee['username'].replace('_', ' ').split()),
+            'username_key': employee['username_key'],
+            'team': employee['team'],
+            'role': employee['role']
+        })
+
+    # Hours per employee for the selected period, from the daily aggregates
+    clauses, params = filter_clauses(filters, 'd', team_id)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    hour_totals = conn.execute(
+        'SELECT u.username, t.name AS team, ROUND(SUM(d.worked_min) / 60.0, 2) AS total_hours '
+        'FROM hours_daily d JOIN users u ON u.username_key = d.username_key '
+        'LEFT JOIN team_members tm ON tm.user_id = u.id '
+        f'LEFT JOIN teams t ON t.id = tm.team_id{where} '
+        'GROUP BY d.username_key ORDER BY t.name, u.username',
+        params
+    ).fetchall()
+
+    # Every query has run by now; only the HTML is produced as the page streams out
+    return stream_template(
+        'admin_dashboard.html', teams=teams.keys(), employees=employee_list, entries=entries,
+        invoices=invoices, filters=filters, hour_totals=hour_totals
+    )
+
+def parse_period(filters):
+    """Check the from/to filters are YYYY-MM-DD dates; returns an error message or None."""
+    for name in ('from', 'to'):
+        if filters[name]:
+            try:
+                datetime.strptime(filters[name], '%Y-%m-%d')
+            except ValueError:
+                return f"'{name}' must be a YYYY-MM-DD date"
+    return None
+
+
+@app.route('/api/payroll_summary', methods=['GET'])
+@versioned_page(admin_dashboard_scopes, cache=False)
+def payroll_summary():
+    conn = get_db_connection()
+    filters = admin_filters(request.args)
+    error = parse_period(filters)
+    if error:
+        return jsonify({'error': error}), 400
+    teams = team_cache.teams(conn)
+    if filters['team'] and filters['team'] not in teams:
+        return jsonify({'error': 'Team not found'}), 404
+    team_id = teams[filters['team']]['id'] if filters['team'] else None
+
+    # One pass over the daily aggregates: per-employee totals, with the
+    # team totals computed alongside by window functions
+    clauses, params = filter_clauses(filters, 'd', team_id)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = conn.execute(
+        'SELECT t.name AS team, u.username, u.rate_per_hour, SUM(d.worked_min) AS worked_min, '
+        'SUM(d.worked_min * u.rate_per_hour) AS pay_min, '
+        'SUM(SUM(d.worked_min)) OVER (PARTITION BY tm.team_id) AS team_min, '
+        'SUM(SUM(d.worked_min * u.rate_per_hour)) OVER (PARTITION BY tm.team_id) AS team_pay_min '
+        'FROM hours_daily d JOIN users u ON u.username_key = d.username_key '
+        'LEFT JOIN team_members tm ON tm.user_id = u.id '
+        f'LEFT JOIN teams t ON t.id = tm.team_id{where} '
+        'GROUP BY d.username_key ORDER BY t.name, u.username',
+        params
+    )
+
+    summary = {}
+    total_min = total_pay_min = 0
+    for row in rows:
+        team = summary.get(row['team'])
+        if team is None:
+            team = summary[row['team']] = {
+                'team': row['team'],
+                'hours': round(row['team_min'] / 60, 2),
+                'payment': round((row['team_pay_min'] or 0) / 60, 2),
+                'employees': [],
+            }
+            total_min += row['team_min']
+            total_pay_min += row['team_pay_min'] or 0
+        team['employees'].append({
+            'username': row['username'],
+            'rate': row['rate_per_hour'],
+            'hours': round(row['worked_min'] / 60, 2),
+            'payment': None if row['pay_min'] is None else round(row['pay_min'] / 60, 2),
+        })
+
+    return jsonify({
+        'from': filters['from'] or None,
+        'to': filters['to'] or None,
+        'hours': round(total_min / 60, 2),
+        'payment': round(total_pay_min / 60, 2),
+        'teams': list(summary.values()),
+    })
+
+
+def stream_csv(cursor):
+    """
+    Yield a cursor as CSV text, header first, in STREAM_CHUNK_BYTES pieces.
+
+    Rows are written into one reused buffer, so memory stays constant no
+    matter how many rows the query returns.
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([column[0] for column in cursor.description])
+    for row in cursor:
+        writer.writerow(row)
+        if buffer.tell() >= STREAM_CHUNK_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    cursor.close()
+    yield buffer.getvalue()
+
+
+def export_csv(sql, alias, key_column, filename):
+    """
+    Stream ``sql`` filtered by the admin filters as a CSV download, oldest first.
+
+    The query only starts once the client begins reading the body.
+    """
+    conn = get_db_connection()
+    filters = admin_filters(request.args)
+    error = parse_period(filters)
+    if error:
+        return jsonify({'error': error}), 400
+    teams = team_cache.teams(conn)
+    if filters['team'] and filters['team'] not in teams:
+        return jsonify({'error': 'Team not found'}), 404
+    team_id = teams[filters['team']]['id'] if filters['team'] else None
+
+    query = filtered_query(sql, *filter_clauses(filters, alias, team_id), alias, key_column, newest_first=False)
+    # The rows are read while the body streams, after the request ends
+    conn = stream_db_connection()
+
+    def generate():
+        yield from stream_csv(conn.execute(*query))
+
+    return app.response_class(
+        stream_with_context(generate()), mimetype='text/csv',
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+@app.route('/export/time_entries.csv', methods=['GET'])
+@versioned_page(admin_dashboard_scopes, cache=False)
+def export_time_entries():
+    return export_csv(
+        'SELECT te.id, te.date, te.username AS employee, t.name AS team, te.start_time, te.end_time, '
+        'ROUND(te.worked_min / 60.0, 2) AS hours, u.rate_per_hour AS rate, '
+        'ROUND(te.worked_min * u.rate_per_hour / 60.0, 2) AS payment '
+        'FROM time_entries te LEFT JOIN users u ON u.id = te.user_id '
+        'LEFT JOIN team_members tm ON tm.user_id = te.user_id '
+        'LEFT JOIN teams t ON t.id = tm.team_id',
+        'te', 'id', 'time_entries.csv'
+    )
+
+
+@app.route('/export/invoices.csv', methods=['GET'])
+@versioned_page(admin_dashboard_scopes, cache=False)
+def export_invoices():
+    return export_csv(
+        'SELECT inv.invoice_number, inv.date, inv.username AS employee, t.name AS team, '
+        'ROUND(inv.total_hours, 2) AS hours, ROUND(inv.total_payment, 2) AS payment, inv.sent, inv.filename '
+        'FROM invoices inv LEFT JOIN team_members tm ON tm.user_id = inv.user_id '
+        'LEFT JOIN teams t ON t.id = tm.team_id',
+        'inv', 'invoice_number', 'invoices.csv'
+    )
+
+
+@app.route('/invoices/bundle.zip', methods=['GET'])
+def invoice_bundle():
+    """
+    Stream the PDFs of the invoices matching the admin filters as one ZIP.
+
+    Not a versioned_page: the archive also depends on which PDFs are on
+    disk, which data_versions does not track.
+    """
+    conn = get_db_connection()
+    filters = admin_filters(request.args)
+    error = parse_period(filters)
+    if error:
+        return jsonify({'error': error}), 400
+    teams = team_cache.teams(conn)
+    if filters['team'] and filters['team'] not in teams:
+        return jsonify({'error': 'Team not found'}), 404
+    team_id = teams[filters['team']]['id'] if filters['team'] else None
+
+    rows = conn.execute(*filtered_query(
+        INVOICE_BUNDLE_SQL, *filter_clauses(filters, 'inv', team_id), 'inv', 'invoice_number', newest_first=False
+    )).fetchall()
+    # Only (number, filename) pairs are needed from here on: give the
+    # connection back so a slow download holds no pool slot or WAL snapshot
+    release_db_connection(None)
+
+    missing, numbers = [], {}
+
+    def entries():
+        for invoice_number, filename in rows:
+            filename = os.path.basename(filename or '')
+            pending = invoice_writer.pending(filename) if filename else None
+            if pending is not None:
+                yield filename, pending
+            elif filename:
+                # stream_zip reports the file through file_missing if it is gone
+                numbers[filename] = invoice_number
+                yield filename, invoice_store.path(invoice_number, filename)
+            else:
+                missing.append(f"{invoice_number}\t(no file)")
+        if missing:
+            # Tell the reader which invoices are not in the archive
+            app.logger.error(f"Invoice bundle is missing {len(missing)} PDFs")
+            yield 'MISSING.txt', ('\n'.join(['invoice_number\tfilename'] + missing) + '\n').encode()
+
+    def file_missing(filename, path):
+        missing.append(f"{numbers[filename]}\t{filename}")
+
+    # The first bytes go out with the first PDF; no archive is built up front
+    return app.response_class(
+        stream_with_context(stream_zip(entries(), STREAM_CHUNK_BYTES, file_missing)), mimetype='application/zip',
+        headers={'Content-Disposition': 'attachment; filename=invoices.zip'}
+    )
 
-    return render_template('admin_dashboard.html', teams=teams.keys(), employees=employee_list, entries=entry_list, invoices=invoice_list)
 
 @app.route('/add_employee', methods=['POST'])
 def add_employee():
@@ -201,59 +712,51 @@ def add_employee():
         return jsonify({'error': 'All fields are required!'}), 400
 
     try:
+        username = name.lower().replace(" ", "_")
         conn = get_db_connection()
         conn.execute(
-            'INSERT INTO users (username, password, role, phone_number) VALUES (?, ?, ?, ?)',
-            (name.lower().replace(" ", "_"), '123', role, phone_number)
+            'INSERT INTO users (username, username_key, password, role, phone_number) VALUES (?, ?, ?, ?, ?)',
+            (username, normalize_username(username), '123', role, phone_number)
         )
         conn.commit()
-        conn.close()
         return redirect(url_for('admin_dashboard'))
     except sqlite3.IntegrityError:
         return jsonify({'error': 'User already exists!'}), 400
 
+@app.route('/assign_team', methods=['POST'])
+def assign_team_route():
+    username = request.form.get('username')
+    team = request.form.get('team', '').strip()
+
+    if not username:
+        return jsonify({'error': 'Employee is required!'}), 400
+
+    try:
+        conn = get_db_connection()
+        if not assign_team(conn, username, team):
+            return jsonify({'error': 'Employee not found'}), 404
+        conn.commit()
+        team_cache.invalidate()
+        return redirect(url_for('admin_dashboard'))
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Error updating team: {e}"}), 500
+
 @app.route('/employee_dashboard/<username>')
+@versioned_page(lambda conn, username: (f"user:{normalize_username(username)}",))
 def employee_dashboard(username):
-    conn = get_db_connection()
-    # Fetch time entries for the logged-in employee
-    entries = conn.execute(
-        'SELECT * FROM time_entries WHERE LOWER(REPLACE(username, " ", "")) = ?',
-        (username.lower().replace(" ", ""),)
-    ).fetchall()
-    
-    # Fetch invoices for the logged-in employee
-    invoices = conn.execute(
-        'SELECT invoice_number, date, total_hours, total_payment, filename, sent '
-        'FROM invoices WHERE LOWER(REPLACE(username, " ", "")) = ? ORDER BY date DESC',
-        (username.lower().replace(" ", ""),)
-    ).fetchall()
-    conn.close()
+    # The template reads the cursors below after the view has returned
+    conn = stream_db_connection()
+    username_key = normalize_username(username)
+    # Recent weekly totals, from the weekly aggregates
+    weekly_hours = conn.execute(WEEKLY_HOURS_SQL, (username_key,)).fetchall()
 
-    # Prepare time entries for rendering
-    entry_list = []
-    for entry in entries:
-        entry_data = {
-            'date': entry['date'],
-            'start_time': entry['start_time'],
-            'end_time': entry['end_time'],
-            'total_hours': round((datetime.strptime(entry['end_time'], "%H:%M") - datetime.strptime(entry['start_time'], "%H:%M") - timedelta(minutes=30)).seconds / 3600.0, 2)
-        }
-        entry_list.append(entry_data)
-    
-    # Prepare invoices for rendering
-    invoice_list = []
-    for invoice in invoices:
-        invoice_data = {
-            'invoice_number': invoice['invoice_number'],
-            'date': invoice['date'],
-            'total_hours': invoice['total_hours'],
-            'total_payment': invoice['total_payment'],
-            'filename': invoice['filename'],
-            'sent': invoice['sent']
-        }
-        invoice_list.append(invoice_data)
+    # Time entries and invoices for the logged-in employee; the template
+    # iterates the cursors directly, so rows go out as they are read
+    entries = conn.execute(USER_ENTRIES_SQL, (username_key,))
+    invoices = conn.execute(USER_INVOICES_SQL, (username_key,))
 
-    return render_template('employee_dashboard.html', username=username, entries=entry_list, invoices=invoice_list)
+    return stream_template('employee_dashboard.html', username=username, entries=entries, invoices=invoices,
+                           weekly_hours=weekly_hours)
 
 
 @app.route('/add_time_entry', methods=['POST'])
@@ -268,19 +771,17 @@ def add_time_entry():
 
     try:
         conn = get_db_connection()
-        conn.execute(
-            'INSERT INTO time_entries (username, date, start_time, end_time) VALUES (?, ?, ?, ?)',
-            (username, date, start_time, end_time)
-        )
+        insert_time_entry(conn, username, date, start_time, end_time)
         conn.commit()
-        conn.close()
         return redirect(url_for('employee_dashboard', username=username))
+    except ValueError:
+        return jsonify({'error': 'Times must be in HH:MM format!'}), 400
     except sqlite3.Error as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/delete_time_entry', methods=['POST'])
 def delete_time_entry():
-    username = request.form.get('username').strip().lower().replace(" ", "_")
+    username_key = normalize_username(request.form.get('username').strip())
     date = request.form.get('date')
     start_time = request.form.get('start_time')
     end_time = request.form.get('end_time')
@@ -291,8 +792,8 @@ def delete_time_entry():
 
         cursor.execute('''
             DELETE FROM time_entries 
-            WHERE username = ? AND date = ? AND start_time = ? AND end_time = ?
-        ''', (username, date, start_time, end_time))
+            WHERE username_key = ? AND date = ? AND start_time = ? AND end_time = ?
+        ''', (username_key, date, start_time, end_time))
 
         if cursor.rowcount == 0:
             message = "No matching entry found to delete."
@@ -300,15 +801,235 @@ def delete_time_entry():
             conn.commit()
             message = "Entry deleted successfully."
 
-        conn.close()
         return jsonify({'message': message}), 200
 
     except sqlite3.Error as e:
         return jsonify({'error': f"Error during deletion: {e}"}), 500
 
+@app.route('/time_entries/bulk', methods=['POST'])
+def bulk_add_time_entries():
+    """
+    Add a week grid of time entries for one or many employees at once.
+
+    Expects JSON shaped as
+    {"employees": {"<username>": {"<YYYY-MM-DD>": {"start_time": "HH:MM", "end_time": "HH:MM"}}}}
+    and answers with one result per grid cell, in the same order.
+    """
+    payload = request.get_json(silent=True)
+    if not isinstance(payload, dict):
+        return jsonify({'error': 'Expected a JSON object with an "employees" key'}), 400
+    grid = payload.get('employees')
+    if not isinstance(grid, dict) or not grid:
+        return jsonify({'error': 'Expected an "employees" object mapping usernames to days'}), 400
+
+    rows = []
+    for username, days in grid.items():
+        if not isinstance(days, dict):
+            return jsonify({'error': f'Days for {username} must be an object keyed by date'}), 400
+        for date, shift in days.items():
+            shift = shift if isinstance(shift, dict) else {}
+            rows.append((username, date, shift.get('start_time'), shift.get('end_time')))
+
+    try:
+        conn = get_db_connection()
+        results = bulk_insert_time_entries(conn, rows)
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Error saving time entries: {e}"}), 500
+
+    for (username, date, _, _), result in zip(rows, results):
+        result['username'] = username
+        result['date'] = date
+    inserted = sum(1 for result in results if result['ok'])
+    return jsonify({'inserted': inserted, 'failed': len(results) - inserted, 'results': results}), 200
+
+
+# Printed on every invoice
+COMPANY_INFO = {
+    "Company Name": "GOAT Removals",
+    "Address": "19 O'Neile Crescent, NSW, 2170, Australia",
+    "Phone": "+61 2 1234 5678"
+}
+
+
+def send_invoice_pdf(filename, as_attachment=True):
+    """Send an invoice PDF, from memory while its write to disk is still pending."""
+    data = invoice_writer.pending(filename)
+    if data is not None:
+        return send_file(io.BytesIO(data), mimetype='application/pdf', as_attachment=as_attachment,
+                         download_name=filename)
+    path = invoice_store.locate(filename)
+    if path is None:
+        return jsonify({'error': 'File not found'}), 404
+    return send_file(path, mimetype='application/pdf', as_attachment=as_attachment, download_name=filename)
+
+
+def invoice_pdf_exists(filename):
+    """True once an invoice PDF is stored or queued to be written there."""
+    return invoice_writer.pending(filename) is not None or invoice_store.locate(filename) is not None
+
+
+def create_invoice(conn, username, on_commit):
+    """
+    Bill an employee's unbilled time entries: render the invoice PDF, insert
+    its invoices row and link the entries to it.
+
+    Only entries no invoice has billed yet are picked up, and they are
+    stamped in the same transaction as the insert, which the caller owns and
+    must commit. With nothing left to bill, the user's latest invoice is
+    returned instead and nothing is written. A PDF already rendered for the
+    same entries, rate and layout whose insert never committed (a failed or
+    retried job) is reused along with its number.
+
+    The PDF is rendered into memory and only handed to invoice_writer from
+    a callback registered with ``on_commit``, so no file is stored for an
+    invoice whose row was rolled back; its bytes come back under 'pdf' so
+    the caller can send them right away.
+
+    Args:
+        conn (sqlite3.Connection): A connection with no open transaction.
+        username (str): The normalized username.
+        on_commit (callable): Registers a callback the caller runs once it
+            has committed, and drops if it rolls back.
+
+    Returns:
+        dict: The invoice's number and PDF filename, plus its bytes under
+            'pdf' when they have yet to be stored.
+
+    Raises:
+        ValueError: If the user does not exist or has nothing to bill.
+        RuntimeError: If the PDF could not be rendered, or another invoice
+            billed the entries first.
+    """
+    # Fetch the hourly rate for the user
+    user_data = conn.execute(USER_RATE_SQL, (username,)).fetchone()
+
+    if not user_data:
+        app.logger.info(f"No user found with username {username}")
+        raise ValueError('User not found')
+
+    hourly_rate = user_data['hourly_rate']
+
+    # Fetch the entries not billed yet (idx_time_entries_open covers this)
+    entries = conn.execute(OPEN_ENTRIES_SQL, (username,)).fetchall()
+
+    if not entries:
+        # Everything is billed already: hand back the latest invoice
+        latest = conn.execute(LATEST_INVOICE_SQL, (username,)).fetchone()
+        if latest and invoice_pdf_exists(latest['filename']):
+            app.logger.info(f"Invoice {latest['invoice_number']} reused for user {username}; nothing new to bill")
+            return {'invoice_number': latest['invoice_number'], 'filename': latest['filename']}
+        app.logger.info(f"No unbilled time entries found for user {username}")
+        raise ValueError('No unbilled time entries for this user')
+
+    # Process data
+    entry_ids = [entry['id'] for entry in entries]
+    timesheet_data = [
+        (entry['date'], entry['start_time'], entry['end_time'], entry['hours'])
+        for entry in entries
+    ]
+    total_hours = sum(entry['worked_min'] or 0 for entry in entries) / 60.0
+
+    # Same entries already rendered under a number that was never saved:
+    # reuse both instead of burning another number
+    render_key = invoice_cache.key(
+        username, entry_ids, timesheet_data, total_hours, hourly_rate, COMPANY_INFO, INVOICE_TEMPLATE_VERSION
+    )
+    cached = invoice_cache.get(render_key, lambda invoice: conn.execute(
+        'SELECT 1 FROM invoices WHERE invoice_number = ?',
+        (invoice['invoice_number'],)
+    ).fetchone() is None)
+    if cached:
+        app.logger.info(f"Invoice {cached['invoice_number']} PDF reused for user {username}; entries unchanged")
+        invoice_number, filename, pdf = cached['invoice_number'], cached['filename'], cached.get('pdf')
+    else:
+        # Invoice data; the number is reserved before rendering so the PDF
+        # name can never collide with another worker's
+        invoice_number = invoice_numbers.next_number(conn)
+
+        # Generate invoice
+        buffer = io.BytesIO()
+        filepath = generate_invoice(invoice_number, username, COMPANY_INFO, timesheet_data, total_hours,
+                                    hourly_rate, output=buffer)
+        if not filepath:
+            app.logger.error(f"Invoice generation failed for user {username}")
+            raise RuntimeError(f"Invoice {invoice_number} failed to render")
+        pdf = buffer.getvalue()
+        filename = os.path.basename(filepath)  # Save only the filename
+        # Keep the bytes until the commit stores them, for a retry to reuse
+        invoice_cache.put(render_key, {'invoice_number': invoice_number, 'filename': filename, 'pdf': pdf})
+
+    # Save to database and mark the entries billed, in one transaction
+    conn.execute(
+        """
+        INSERT INTO invoices (invoice_number, username, username_key, user_id, date,
+                              total_hours, total_payment, filename, sent)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0)
+        """,
+        (
+            invoice_number,
+            username,
+            username,
+            user_data['id'],
+            datetime.now().strftime("%Y-%m-%d"),
+            total_hours,
+            total_hours * hourly_rate,
+            filename
+        )
+    )
+    bill_time_entries(conn, invoice_number, entry_ids)
+    app.logger.info(f"Invoice {invoice_number} generated successfully for user {username}")
+    invoice = {'invoice_number': invoice_number, 'filename': filename}
+    if pdf is not None:
+        def store_pdf():
+            invoice_cache.discard(render_key)
+            invoice_writer.submit(invoice_number, filename, pdf)
+        on_commit(store_pdf)
+        invoice['pdf'] = pdf
+    return invoice
+
+
+def connect_job_worker():
+    """Open a job worker's own connection, configured like the pooled ones."""
+    conn = sqlite3.connect(DB_PATH)
+    conn.row_factory = sqlite3.Row
+    configure_pooled_connection(conn)
+    return conn
+
+
+def run_invoice_job(conn, payload, progress, on_commit):
+    """Job handler: bill a user, storing the PDF once the job commits."""
+    invoice = create_invoice(conn, payload['username'], on_commit)
+    invoice.pop('pdf', None)  # Served from invoice_writer until it is stored
+    return invoice
+
+
+invoice_jobs = JobQueue(
+    connect_job_worker,
+    {
+        'invoice': run_invoice_job,
+        'payroll': lambda conn, payload, progress, on_commit: run_payroll(
+            conn, invoice_numbers, COMPANY_INFO, payload['from'], payload['to'], payload['team_id'],
+            PAYROLL_WORKERS, progress
+        ),
+    },
+    JOB_WORKERS, JOB_MAX_ATTEMPTS, JOB_RETRY_DELAY
+)
+
+
+@app.before_request
+def start_job_workers():
+    """
+    Start this process's job workers with the first request it serves.
+
+    Not at import: CLI commands never need them, and a gunicorn master that
+    preloads the app would lose its threads when it forks the workers.
+    """
+    invoice_jobs.start()
+
+
 @app.route('/generate_invoice', methods=['POST'])
 def generate_invoice_route():
-    username = request.form.get('username').strip().lower().replace(" ", "")
+    username = normalize_username(request.form.get('username').strip())
 
     if not username:
         app.logger.error("Username is required for generating an invoice")
@@ -316,94 +1037,107 @@ def generate_invoice_route():
 
     try:
         conn = get_db_connection()
+        committed = []
+        invoice = create_invoice(conn, username, committed.append)
+        conn.commit()
+        for callback in committed:
+            callback()
+        if 'pdf' in invoice:
+            # Freshly rendered: answer from memory while the writer saves it
+            return send_file(io.BytesIO(invoice['pdf']), mimetype='application/pdf', as_attachment=True,
+                             download_name=invoice['filename'])
+        return send_invoice_pdf(invoice['filename'])
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        app.logger.error(f"Failed to generate invoice for {username}: {str(e)}")
+        return jsonify({'error': f"Failed to generate invoice: {str(e)}"}), 500
 
-        # Fetch the hourly rate for the user
-        user_data = conn.execute(
-            'SELECT hourly_rate FROM users WHERE LOWER(REPLACE(username, " ", "")) = ?',
-            (username,)
-        ).fetchone()
-
-        if not user_data:
-            app.logger.info(f"No user found with username {username}")
-            return jsonify({'error': 'User not found'}), 400
-
-        hourly_rate = user_data['hourly_rate']
-
-        # Fetch time entries
-        entries = conn.execute(
-            'SELECT date, start_time, end_time FROM time_entries WHERE LOWER(REPLACE(username, " ", "")) = ?',
-            (username,)
-        ).fetchall()
-
-        if not entries:
-            app.logger.info(f"No time entries found for user {username}")
-            return jsonify({'error': 'No time entries found for this user'}), 400
-
-        # Invoice data
-        invoice_date = datetime.now().strftime("%Y-%m-%d")
-        invoice_number = conn.execute(
-            'SELECT COALESCE(MAX(invoice_number), 0) + 1 FROM invoices'
-        ).fetchone()[0]
-
-        # Process data
-        timesheet_data = [
-            (entry['date'], entry['start_time'], entry['end_time'],
-             round((datetime.strptime(entry['end_time'], "%H:%M") - datetime.strptime(entry['start_time'], "%H:%M") - timedelta(minutes=30)).seconds / 3600.0, 2))
-            for entry in entries
-        ]
-        total_hours = sum(entry[3] for entry in timesheet_data)
 
-        # Generate invoice
-        filepath = generate_invoice(invoice_number, username, {
-            "Company Name": "GOAT Removals",
-            "Address": "19 O'Neile Crescent, NSW, 2170, Australia",
-            "Phone": "+61 2 1234 5678"
-        }, timesheet_data, total_hours, hourly_rate)
-
-        # Check if the file exists
-        if not filepath or not os.path.exists(filepath):
-            app.logger.error(f"Invoice generation failed. File not found: {filepath}")
-            return jsonify({'error': f"Invoice file not found at {filepath}"}), 500
-
-        # Save to database (Store only the filename)
-        conn.execute(
-            """
-            INSERT INTO invoices (invoice_number, username, date, total_hours, total_payment, filename, sent)
-            VALUES (?, ?, ?, ?, ?, ?, 0)
-            """,
-            (
-                invoice_number,
-                username,
-                invoice_date,
-                total_hours,
-                total_hours * hourly_rate,
-                os.path.basename(filepath)  # Save only the filename
-            )
+def job_status(job):
+    """A job as returned to clients, with its download link once an invoice PDF exists."""
+    status = {key: job[key] for key in ('id', 'kind', 'status', 'attempts', 'progress', 'error',
+                                        'created_at', 'finished_at')}
+    status['status_url'] = url_for('invoice_job_status', job_id=job['id'])
+    if job['status'] == 'done':
+        if job['kind'] == 'invoice':
+            status['invoice_number'] = job['result']['invoice_number']
+            status['download_url'] = url_for('download_invoice_job', job_id=job['id'])
+        else:
+            status['result'] = job['result']
+    return status
+
+
+@app.route('/invoice_jobs', methods=['POST'])
+def enqueue_invoice_job():
+    username = normalize_username((request.form.get('username') or '').strip())
+    if not username:
+        return jsonify({'error': 'Username is required'}), 400
+
+    try:
+        conn = get_db_connection()
+        job_id, created = invoice_jobs.enqueue(conn, 'invoice', {'username': username}, f'invoice:{username}')
+        status = job_status(invoice_jobs.get(conn, job_id))
+        status['deduplicated'] = not created
+        return jsonify(status), 202, {'Location': status['status_url']}
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Error queueing invoice: {e}"}), 500
+
+
+@app.route('/payroll_run', methods=['POST'])
+def payroll_run():
+    filters = admin_filters(request.form)
+    error = parse_period(filters)
+    if error:
+        return jsonify({'error': error}), 400
+
+    try:
+        conn = get_db_connection()
+        teams = team_cache.teams(conn)
+        if filters['team'] and filters['team'] not in teams:
+            return jsonify({'error': 'Team not found'}), 404
+        team_id = teams[filters['team']]['id'] if filters['team'] else None
+
+        job_id, created = invoice_jobs.enqueue(
+            conn, 'payroll', {'from': filters['from'], 'to': filters['to'], 'team_id': team_id},
+            f"payroll:{filters['from']}:{filters['to']}:{team_id}"
         )
-        conn.commit()
+        status = job_status(invoice_jobs.get(conn, job_id))
+        status['deduplicated'] = not created
+        return jsonify(status), 202, {'Location': status['status_url']}
+    except sqlite3.Error as e:
+        return jsonify({'error': f"Error queueing payroll run: {e}"}), 500
 
-        app.logger.info(f"Invoice {invoice_number} generated successfully for user {username}")
-        return send_file(filepath, as_attachment=True)
 
-    except Exception as e:
-        app.logger.error(f"Failed to generate invoice for {username}: {str(e)}")
-        return jsonify({'error': f"Failed to generate invoice: {str(e)}"}), 500
+@app.route('/invoice_jobs/<int:job_id>', methods=['GET'])
+def invoice_job_status(job_id):
+    job = invoice_jobs.get(get_db_connection(), job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job_status(job))
+
+
+@app.route('/invoice_jobs/<int:job_id>/download', methods=['GET'])
+def download_invoice_job(job_id):
+    job = invoice_jobs.get(get_db_connection(), job_id)
+    if job is None or job['kind'] != 'invoice':
+        return jsonify({'error': 'Invoice job not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': f"Invoice is not ready (status: {job['status']})"}), 409
+    return send_invoice_pdf(job['result']['filename'])
 
-    finally:
-        conn.close()
 
 @app.route('/employee_invoices/<username>', methods=['GET'])
+@versioned_page(lambda conn, username: (f"user:{normalize_username(username)}",), cache=False)
 def employee_invoices(username):
     conn = get_db_connection()
     try:
-        query = 'SELECT invoice_number, date, total_hours, total_payment, filename FROM invoices WHERE username = ? ORDER BY date DESC'
-        invoices = conn.execute(query, (username,)).fetchall()
+        invoices = conn.execute(USER_INVOICES_SQL, (normalize_username(username),)).fetchall()
         invoices_list = [{'invoice_number': invoice['invoice_number'], 'date': invoice['date'], 'total_hours': invoice['total_hours'], 'total_payment': invoice['total_payment'], 'filename': invoice['filename']} for invoice in invoices]
         return jsonify(invoices_list)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 
 @app.route('/send_invoice_to_db', methods=['POST'])
@@ -416,10 +1150,7 @@ def send_invoice_to_db():
 
     try:
         # Retrieve the most recent unsent invoice for the user
-        existing_invoice = conn.execute(
-            'SELECT * FROM invoices WHERE username = ? AND sent = 0 ORDER BY date DESC LIMIT 1',
-            (username,)
-        ).fetchone()
+        existing_invoice = conn.execute(LATEST_UNSENT_INVOICE_SQL, (normalize_username(username),)).fetchone()
 
         if not existing_invoice:
             return jsonify({'error': 'No generated invoice found for this user to send.'}), 400
@@ -436,33 +1167,166 @@ def send_invoice_to_db():
     except sqlite3.Error as e:
         return jsonify({'error': f"Database error: {e}"}), 500
 
-    finally:
-        conn.close()
 
         
 @app.route('/download_invoice/<filename>')
 def download_invoice(filename):
     try:
         # Define the directory where invoices are stored
-        directory = "/tmp/invoices"
-        file_path = os.path.join(directory, filename)
-
-        # Log the directory and file name for debugging
-        app.logger.info(f"Looking for file in directory: {directory}")
+        # Log the file name for debugging
         app.logger.info(f"Requested file: {filename}")
 
-        # Check if the file exists
-        if not os.path.exists(file_path):
-            app.logger.error(f"File not found: {file_path}")
+        # Check if the file exists (or is still being written)
+        if not invoice_pdf_exists(filename):
+            app.logger.error(f"File not found in invoice store: {filename}")
             return jsonify({"error": "File not found"}), 404
 
         # Serve the file
-        return send_from_directory(directory, filename, as_attachment=False)
+        return send_invoice_pdf(filename, as_attachment=False)
     except Exception as e:
         app.logger.error(f"Error serving the invoice: {str(e)}")
         return jsonify({"error": f"Error serving the invoice: {str(e)}"}), 500
 
 
-    
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """Fail if any hot route query falls back to a full table scan."""
+    conn = get_db_connection()
+    scans = find_table_scans(conn)
+    for name, detail in scans:
+        print(f"{name}: {detail}")
+    if scans:
+        raise SystemExit(1)
+    print("All hot queries are served by indexes.")
+
+
+@app.cli.command('payroll-run')
+@click.option('--from', 'period_from', default='', help='First date included (YYYY-MM-DD).')
+@click.option('--to', 'period_to', default='', help='Last date included (YYYY-MM-DD).')
+@click.option('--team', default='', help='Only invoice this team.')
+@click.option('--workers', type=int, default=PAYROLL_WORKERS, help='Render processes (default: CPU count).')
+def payroll_run_command(period_from, period_to, team, workers):
+    """Generate invoices for every employee with hours in a pay period."""
+    conn = get_db_connection()
+    error = parse_period({'from': period_from, 'to': period_to})
+    if error:
+        raise click.BadParameter(error)
+    teams = team_cache.teams(conn)
+    if team and team not in teams:
+        raise click.BadParameter(f"Unknown team '{team}'", param_hint='--team')
+
+    def progress(done, total):
+        print(f"\rRendered {done}/{total} invoices", end='', flush=True)
+
+    summary = run_payroll(
+        conn, invoice_numbers, COMPANY_INFO, period_from, period_to,
+        teams[team]['id'] if team else None, workers, progress
+    )
+    conn.commit()
+    print()
+    for key, value in summary.items():
+        print(f"{key}: {value}")
+
+
+@app.cli.command('benchmark-invoice-render')
+@click.option('--count', type=int, default=200, help='Invoices rendered per run.')
+@click.option('--entries', type=int, default=20, help='Timesheet rows per invoice.')
+@click.option('--logo', default=LOGO_PATH, help='Logo to render with (default: company_logo.png).')
+def benchmark_invoice_render(count, entries, logo):
+    """Time invoice rendering with a render context built per invoice and with a shared one."""
+    timesheet_data = [(f"2026-01-{day % 28 + 1:02d}", "08:00", "16:30", 8.5) for day in range(entries)]
+    total_hours = 8.5 * entries
+
+    with tempfile.TemporaryDirectory() as directory:
+        def run(shared):
+            context = InvoiceRenderContext(COMPANY_INFO, InvoiceStore(directory), logo)
+            started = time.perf_counter()
+            for number in range(1, count + 1):
+                if not shared:
+                    # What every invoice paid before the context was shared
+                    context = InvoiceRenderContext(COMPANY_INFO, InvoiceStore(directory), logo)
+                if not generate_invoice(number, "benchmark", COMPANY_INFO, timesheet_data, total_hours,
+                                        30.0, context):
+                    raise click.ClickException(f"Invoice {number} failed to render")
+            return (time.perf_counter() - started) / count * 1000
+
+        per_invoice = run(shared=False)
+        shared = run(shared=True)
+    print(f"context per invoice: {per_invoice:.2f} ms/invoice")
+    print(f"shared context:      {shared:.2f} ms/invoice")
+
+
+@app.cli.command('check-invoice-files')
+@click.option('--repair', is_flag=True, help='Recover missing PDFs from /tmp/invoices and drop stale temp files.')
+@click.option('--remove-orphans', is_flag=True, help='Delete PDFs older than an hour that no invoice refers to.')
+def check_invoice_files(repair, remove_orphans):
+    """Reconcile invoices rows with the PDFs in the invoice store."""
+    report = invoice_store.check(get_db_connection(), repair, remove_orphans)
+    print(f"{report['rows']} invoices, {report['files']} stored PDFs in {invoice_store.root}.")
+    for invoice_number, filename in report['recovered']:
+        print(f"recovered: invoice {invoice_number} {filename}")
+    for invoice_number, filename in report['missing']:
+        print(f"missing: invoice {invoice_number} {filename}")
+    for path in report['orphans']:
+        print(f"orphan{' (removed)' if path in report['removed'] else ''}: {path}")
+    for path in report['temporary']:
+        print(f"temporary{' (removed)' if path in report['removed'] else ''}: {path}")
+    if report['missing']:
+        raise SystemExit(1)
+
+
+@app.cli.command('rebuild-aggregates')
+@click.option('--check', is_flag=True, help='Only report mismatches, do not rebuild.')
+def rebuild_aggregates(check):
+    """Verify the daily/weekly hour aggregates against time_entries and rebuild them."""
+    conn = get_db_connection()
+    mismatches = check_hour_aggregates(conn)
+    for table, stored, expected in mismatches:
+        print(f"{table}: stored={stored} expected={expected}")
+    print(f"{len(mismatches)} mismatched aggregate rows.")
+    if check:
+        if mismatches:
+            raise SystemExit(1)
+        return
+    rebuild_hour_aggregates(conn)
+    print("Hour aggregates rebuilt from time_entries.")
+
+
+@app.route('/admin/db_pool_stats', methods=['GET'])
+def db_pool_stats():
+    """Expose pool size, wait and checkout latency for sizing gunicorn threads."""
+    return jsonify(db_pool.stats())
+
+
+@app.route('/admin/cache_stats', methods=['GET'])
+def cache_stats():
+    """Expose dashboard page cache size and hit rate for this worker."""
+    return jsonify(page_cache.stats())
+
+
+@app.route('/admin/job_stats', methods=['GET'])
+def job_stats():
+    """Expose invoice queue depth, outcomes and wait/run latency."""
+    return jsonify(invoice_jobs.stats(get_db_connection()))
+
+
+@app.route('/admin/invoice_writer_stats', methods=['GET'])
+def invoice_writer_stats():
+    """Expose pending and completed background writes of invoice PDFs."""
+    return jsonify(invoice_writer.stats())
+
+
+@app.route('/admin/invoice_cache_stats', methods=['GET'])
+def invoice_cache_stats():
+    """Expose how often Generate Invoice reused an unchanged render in this worker."""
+    return jsonify(invoice_cache.stats())
+
+
+@app.route('/admin/compression_stats', methods=['GET'])
+def compression_stats():
+    """Expose compressed bytes and CPU time per encoding for tuning the level."""
+    return jsonify(compressor.stats())
+
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
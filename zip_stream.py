@@ -0,0 +1,89 @@
+import io
+import os
+import time
+import zipfile
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable file that hands ZipFile's output back in pieces."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._size += len(data)
+        return len(data)
+
+    def pending(self):
+        return self._size
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        return data
+
+
+def stream_zip(entries, chunk_bytes=16 * 1024, on_missing=None):
+    """
+    Yield a ZIP archive as it is written, without building it in memory or on disk.
+
+    Entries are stored, not deflated: the payloads (PDFs) are compressed
+    already. The output is never seeked, so ZipFile writes each entry's CRC
+    and sizes in a data descriptor after its data, and memory stays at
+    about one chunk no matter how large the archive gets.
+
+    A file that is gone by the time its entry comes up is left out and
+    reported to ``on_missing``, so the archive written so far stays valid.
+
+    Args:
+        entries (iterable): (arcname, source) pairs; source is a file path
+            or the entry's bytes.
+        chunk_bytes (int): Read size, and how much output is gathered before
+            it is yielded.
+        on_missing (callable): Called as ``on_missing(arcname, path)`` for a
+            path that no longer exists. Without it FileNotFoundError is
+            raised.
+
+    Yields:
+        bytes: The next piece of the archive.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+        for arcname, source in entries:
+            if isinstance(source, bytes):
+                info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+                info.file_size = len(source)
+                reader = io.BytesIO(source)
+            else:
+                try:
+                    reader = open(source, "rb")
+                except FileNotFoundError:
+                    if on_missing is None:
+                        raise
+                    on_missing(arcname, source)
+                    continue
+                # Described from the open file, which can no longer vanish
+                stat = os.fstat(reader.fileno())
+                info = zipfile.ZipInfo(arcname, time.localtime(stat.st_mtime)[:6])
+                info.file_size = stat.st_size
+                info.external_attr = (stat.st_mode & 0xFFFF) << 16
+            info.compress_type = zipfile.ZIP_STORED
+            with reader, archive.open(info, "w") as entry:
+                while True:
+                    data = reader.read(chunk_bytes)
+                    if not data:
+                        break
+                    entry.write(data)
+                    if sink.pending() >= chunk_bytes:
+                        yield sink.drain()
+    # Closing the archive wrote the central directory
+    data = sink.drain()
+    if data:
+        yield data